@@ -0,0 +1,216 @@
+"""
+Cliente asyncio para o protocolo do servidor TCP, para uso em scripts e pipelines.
+
+Exemplo:
+    client = await async_client.connect('127.0.0.1', 12345)
+    path, sha256 = await client.fetch('video.mp4')
+    await client.chat('pronto')
+    async for sender, message in client.broadcasts():
+        ...
+    await client.close()
+
+Uma única tarefa lê a conexão e despacha cada mensagem: as respostas (FILE_META,
+STATS, MANIFEST) saem na ordem dos pedidos, pois o servidor atende um pedido por
+vez, e os CHAT do servidor vão para quem estiver inscrito em broadcasts().
+"""
+import asyncio
+import hashlib
+import os
+
+import protocol
+
+DOWNLOAD_DIR = 'client_downloads'
+READ_SIZE = 256 * 1024  # Bytes lidos do socket por vez ao receber um arquivo
+
+#------------------------------------------------------------------------------
+
+class FetchError(Exception):
+    """O servidor não tem o arquivo ou o conteúdo recebido não confere com o SHA-256."""
+
+#------------------------------------------------------------------------------
+
+class Client:
+    """Uma conexão com o servidor TCP. Crie com connect()."""
+
+    def __init__(self, reader, writer, download_dir=DOWNLOAD_DIR):
+        self.reader = reader
+        self.writer = writer
+        self.download_dir = download_dir
+        self._pending = []  # (tipo esperado, future, nome do arquivo), em ordem de pedido
+        self._subscribers = []
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def chat(self, message):
+        """Envia uma mensagem de chat."""
+        await protocol.send_json_async(self.writer, {"type": "CHAT", "message": message})
+
+    async def stats(self):
+        """Retorna as métricas do servidor."""
+        response = await self._request({"type": "STATS"}, 'STATS')
+        return response['metrics']
+
+    async def manifest(self):
+        """Retorna a lista de arquivos do servidor (nome, tamanho, mtime, SHA-256)."""
+        response = await self._request({"type": "MANIFEST"}, 'MANIFEST')
+        return response['files']
+
+    async def fetch(self, filename):
+        """
+        Baixa um arquivo para download_dir e retorna (caminho, SHA-256 verificado).
+        Vários fetch podem estar em andamento na mesma conexão.
+        """
+        return await self._request({"type": "FILE_REQ", "filename": filename}, 'FILE_META', filename)
+
+    async def broadcasts(self):
+        """Itera sobre as mensagens de chat do servidor como (remetente, mensagem)."""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            self._subscribers.remove(queue)
+
+    async def close(self):
+        """Avisa o servidor e fecha a conexão."""
+        try:
+            await protocol.send_json_async(self.writer, {"type": "EXIT"})
+        except ConnectionError:
+            pass
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self._reader_task
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _request(self, message, expected, filename=None):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((expected, future, filename))
+        await protocol.send_json_async(self.writer, message)
+        return await future
+
+    async def _read_loop(self):
+        error = ConnectionError("Server closed connection")
+        try:
+            while True:
+                response = await protocol.receive_json_async(self.reader)
+                if response is None:
+                    break
+                msg_type = response.get('type')
+
+                if msg_type == 'CHAT':
+                    for queue in self._subscribers:
+                        queue.put_nowait((response.get('sender', 'Unknown'), response.get('message')))
+                    continue
+
+                if not self._pending or self._pending[0][0] != msg_type:
+                    # Resposta que ninguém pediu: o fluxo não tem mais como ser
+                    # interpretado com segurança
+                    error = ConnectionError(f"Unexpected {msg_type} from server")
+                    break
+                _, future, filename = self._pending.pop(0)
+
+                if msg_type == 'FILE_META':
+                    try:
+                        result = await self._receive_file(response, filename)
+                    except FetchError as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    if not future.done():
+                        future.set_result(result)
+                elif not future.done():
+                    future.set_result(response)
+        except (ConnectionError, OSError) as e:
+            error = e
+        finally:
+            for _, future, _ in self._pending:
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+            for queue in self._subscribers:
+                queue.put_nowait(None)
+
+    async def _receive_file(self, meta, filename):
+        """Recebe o conteúdo anunciado no FILE_META calculando o SHA-256 durante a leitura."""
+        if meta.get('status') != 'OK':
+            raise FetchError(f"{filename}: {meta.get('message')}")
+
+        filesize = meta['filesize']
+        save_path = os.path.join(self.download_dir, meta['filename'])
+        temp_path = save_path + '.part'
+        os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+
+        sha256_hash = hashlib.sha256()
+        received = 0
+        with open(temp_path, 'wb') as f:
+            while received < filesize:
+                chunk = await self.reader.read(min(READ_SIZE, filesize - received))
+                if not chunk:
+                    raise ConnectionError("Socket closed during file transfer")
+                f.write(chunk)
+                sha256_hash.update(chunk)
+                received += len(chunk)
+
+        local_hash = sha256_hash.hexdigest()
+        if local_hash != meta['sha256']:
+            os.remove(temp_path)
+            raise FetchError(f"{filename}: SHA-256 mismatch")
+        os.replace(temp_path, save_path)
+        return save_path, local_hash
+
+#------------------------------------------------------------------------------
+
+async def connect(host, port, download_dir=DOWNLOAD_DIR):
+    """Abre uma conexão com o servidor e retorna um Client."""
+    reader, writer = await asyncio.open_connection(host, port)
+    return Client(reader, writer, download_dir)
+
+#------------------------------------------------------------------------------
+
+async def fetch_many(requests, download_dir=DOWNLOAD_DIR):
+    """
+    Baixa vários arquivos de um ou mais servidores ao mesmo tempo. 'requests' é uma
+    lista de (host, porta, arquivo); usa uma conexão por servidor. Retorna, na mesma
+    ordem, (caminho, SHA-256) ou a exceção da transferência que falhou.
+    """
+    by_server = {}
+    for host, port, filename in requests:
+        by_server.setdefault((host, port), []).append(filename)
+
+    async def fetch_from(server, filenames):
+        try:
+            client = await connect(*server, download_dir=download_dir)
+        except OSError as e:
+            return [e] * len(filenames)
+        async with client:
+            return await asyncio.gather(*(client.fetch(name) for name in filenames),
+                                        return_exceptions=True)
+
+    servers = list(by_server)
+    outcomes = await asyncio.gather(*(fetch_from(server, by_server[server]) for server in servers))
+
+    results = {}
+    for server, server_results in zip(servers, outcomes):
+        for filename, result in zip(by_server[server], server_results):
+            results.setdefault((server, filename), []).append(result)
+    return [results[((host, port), filename)].pop(0) for host, port, filename in requests]
+
+#------------------------------------------------------------------------------
+
+def parse_address(address):
+    """Converte '@IP:Porta/arquivo' em (ip, porta, arquivo); None em caso de formato inválido."""
+    if not address.startswith('@') or '/' not in address:
+        return None
+    server, filename = address[1:].split('/', 1)
+    host, sep, port = server.rpartition(':')
+    if not sep or not host or not port.isdigit() or not filename:
+        return None
+    return host, int(port), filename
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import async_client
+
+#------------------------------------------------------------------------------
+
+async def run_fetch(args):
+    """Baixa todos os arquivos pedidos ao mesmo tempo e relata cada transferência."""
+    requests = []
+    for address in args.addresses:
+        parsed = async_client.parse_address(address)
+        if parsed is None:
+            print(f"Invalid address '{address}'. Use '@IP:Port/file'.", file=sys.stderr)
+            return 2
+        requests.append(parsed)
+
+    start = time.perf_counter()
+    results = await async_client.fetch_many(requests, args.download_dir)
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    report = []
+    for (host, port, filename), result in zip(requests, results):
+        entry = {"server": f"{host}:{port}", "filename": filename}
+        if isinstance(result, Exception):
+            failures += 1
+            entry.update(ok=False, error=str(result))
+        else:
+            entry.update(ok=True, path=result[0], sha256=result[1])
+        report.append(entry)
+
+    if args.json:
+        print(json.dumps({"elapsed": round(elapsed, 3), "transfers": report}))
+    else:
+        for entry in report:
+            if entry['ok']:
+                print(f"[OK] {entry['server']}/{entry['filename']} -> {entry['path']} ({entry['sha256']})")
+            else:
+                print(f"[FAILED] {entry['server']}/{entry['filename']}: {entry['error']}")
+        print(f"{len(report) - failures}/{len(report)} files in {elapsed:.2f}s")
+    return 1 if failures else 0
+
+#------------------------------------------------------------------------------
+
+async def run_chat(args):
+    """Envia uma mensagem de chat e desconecta."""
+    async with await async_client.connect(args.host, args.port) as client:
+        await client.chat(args.message)
+    return 0
+
+#------------------------------------------------------------------------------
+
+async def run_listen(args):
+    """Imprime as mensagens de broadcast do servidor até a conexão fechar."""
+    async with await async_client.connect(args.host, args.port) as client:
+        async for sender, message in client.broadcasts():
+            print(f"[{sender}]: {message}", flush=True)
+    return 0
+
+#------------------------------------------------------------------------------
+
+async def run_list(args):
+    """Imprime a lista de arquivos do servidor."""
+    async with await async_client.connect(args.host, args.port) as client:
+        files = await client.manifest()
+    if args.json:
+        print(json.dumps(files))
+    else:
+        for entry in files:
+            print(f"{entry['size']:>12}  {entry['sha256'][:12]}  {entry['name']}")
+    return 0
+
+#------------------------------------------------------------------------------
+
+def main():
+    """Cliente TCP sem prompts, para scripts e pipelines."""
+    parser = argparse.ArgumentParser(description="Headless client for the TCP file/chat server.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch = commands.add_parser('fetch', help="download files concurrently")
+    fetch.add_argument('addresses', nargs='+', metavar='@IP:Port/file')
+    fetch.add_argument('--download-dir', default=async_client.DOWNLOAD_DIR)
+    fetch.add_argument('--json', action='store_true', help="print the report as JSON")
+    fetch.set_defaults(handler=run_fetch)
+
+    chat = commands.add_parser('chat', help="send a chat message")
+    chat.add_argument('message')
+    chat.set_defaults(handler=run_chat)
+
+    listen = commands.add_parser('listen', help="print server broadcasts")
+    listen.set_defaults(handler=run_listen)
+
+    listing = commands.add_parser('list', help="list the server's files")
+    listing.add_argument('--json', action='store_true')
+    listing.set_defaults(handler=run_list)
+
+    for command in (chat, listen, listing):
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=12345)
+
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(args.handler(args)))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Could not connect: {e}", file=sys.stderr)
+        sys.exit(1)
+
+#------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
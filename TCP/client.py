@@ -1,10 +1,89 @@
 import socket
 import threading
+import time
 import protocol
+import delta
 import os
 
 DOWNLOAD_DIR = 'client_downloads'  # Pasta para salvar arquivos baixados
 
+# O pedido de reenvio após um delta inválido sai da thread de escuta, então os envios
+# das duas threads são serializados
+send_lock = threading.Lock()
+
+# Uploads aguardando o PUT_READY do servidor: nome no servidor -> caminho local
+pending_uploads = {}
+UPLOAD_CHUNK = 1024 * 1024
+
+#------------------------------------------------------------------------------
+
+def send_message(sock, data_dict):
+    """Envia um JSON ao servidor segurando o lock de envio."""
+    with send_lock:
+        protocol.send_json(sock, data_dict)
+
+#------------------------------------------------------------------------------
+
+def start_upload(sock, local_path):
+    """Calcula o SHA-256 do arquivo local e pede ao servidor para enviá-lo (FILE_PUT)."""
+    filename = os.path.basename(local_path)
+    filehash = protocol.calculate_file_hash(local_path)
+    pending_uploads[filename] = local_path
+    send_message(sock, {
+        "type": "FILE_PUT",
+        "filename": filename,
+        "filesize": os.path.getsize(local_path),
+        "sha256": filehash
+    })
+
+#------------------------------------------------------------------------------
+
+def upload_file(sock, local_path, offset):
+    """
+    Envia o conteúdo do arquivo a partir de 'offset'. Segura o lock de envio até o
+    fim, pois o servidor espera os bytes sem nenhuma mensagem no meio.
+    """
+    try:
+        with send_lock, open(local_path, 'rb') as f:
+            f.seek(offset)
+            for block in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+                sock.sendall(block)
+    except OSError as e:
+        print(f"\n[UPLOAD ERROR] {e}")
+
+#------------------------------------------------------------------------------
+
+def request_file(sock, filename, use_delta=True):
+    """
+    Pede um arquivo ao servidor. Se já existe uma cópia em DOWNLOAD_DIR, envia as
+    assinaturas dos blocos dela para receber só o que mudou.
+    """
+    request = {"type": "FILE_REQ", "filename": filename}
+    local_path = os.path.join(DOWNLOAD_DIR, filename)
+    if use_delta and os.path.isfile(local_path) and os.path.getsize(local_path) > 0:
+        filesize = os.path.getsize(local_path)
+        block_size = delta.choose_block_size(filesize)
+        request["delta"] = {
+            "block_size": block_size,
+            "filesize": filesize,
+            "blocks": delta.block_signatures(local_path, block_size),
+        }
+    send_message(sock, request)
+
+#------------------------------------------------------------------------------
+
+def local_hashes():
+    """SHA-256 de cada arquivo já baixado, pelo nome relativo a DOWNLOAD_DIR."""
+    hashes = {}
+    for root, dirs, files in os.walk(DOWNLOAD_DIR):
+        for name in files:
+            if name.endswith('.tmp'):
+                continue
+            filepath = os.path.join(root, name)
+            relative = os.path.relpath(filepath, DOWNLOAD_DIR).replace(os.sep, '/')
+            hashes[relative] = protocol.calculate_file_hash(filepath)
+    return hashes
+
 #------------------------------------------------------------------------------
 
 def listen_for_messages(sock, stop_event):
@@ -29,6 +108,51 @@ def listen_for_messages(sock, stop_event):
                 print(f"\n>> [{sender}]: {message}")
                 print("Enter command: ", end='', flush=True)
 
+            # Métricas do servidor
+            elif msg_type == 'STATS':
+                print("\n[SERVER STATS]")
+                for name, value in response.get('metrics', {}).items():
+                    if isinstance(value, dict):
+                        value = f"count={value['count']} p50={value['p50']} p99={value['p99']}"
+                    print(f"  {name}: {value}")
+                print("Enter command: ", end='', flush=True)
+
+            # Lista de arquivos do servidor
+            elif msg_type == 'MANIFEST':
+                files = response.get('files', [])
+                print(f"\n[SERVER FILES] {len(files)} file(s)")
+                for entry in files:
+                    modified = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['mtime']))
+                    print(f"  {entry['size']:>12}  {modified}  {entry['sha256'][:12]}  {entry['name']}")
+                print("Enter command: ", end='', flush=True)
+
+            # Servidor pronto para receber um upload
+            elif msg_type == 'PUT_READY':
+                local_path = pending_uploads.get(response.get('filename'))
+                offset = response.get('offset', 0)
+                if offset:
+                    print(f"\n[UPLOADING] Resuming {local_path} at {offset/1024/1024:.2f} MB...")
+                else:
+                    print(f"\n[UPLOADING] Sending {local_path}...")
+                # Envia em outra thread para continuar recebendo chat durante o upload
+                threading.Thread(target=upload_file, args=(sock, local_path, offset),
+                                 daemon=True).start()
+
+            # Resultado de um upload
+            elif msg_type == 'PUT_RESULT':
+                pending_uploads.pop(response.get('filename'), None)
+                if response.get('status') == 'OK':
+                    print(f"\n[UPLOAD DONE] {response.get('message')}")
+                else:
+                    print(f"\n[UPLOAD ERROR] {response.get('message')}")
+                print("Enter command: ", end='', flush=True)
+
+            # Fim de uma sincronização
+            elif msg_type == 'SYNC_END':
+                print(f"\n[SYNC DONE] {response.get('sent')} file(s) downloaded, "
+                      f"{response.get('skipped')} already up to date.")
+                print("Enter command: ", end='', flush=True)
+
             # Metadados de arquivo recebido
             elif msg_type == 'FILE_META':
                 status = response.get('status')
@@ -43,11 +167,25 @@ def listen_for_messages(sock, stop_event):
                     print(f"\n[DOWNLOADING] Receiving {filename} ({filesize/1024/1024:.2f} MB)...")
                     
                     save_path = os.path.join(DOWNLOAD_DIR, filename)
-                    protocol.receive_file_content(sock, save_path, filesize)
-                    
-                    # Verifica integridade do arquivo baixado
-                    print("[VERIFYING] Calculating SHA-256...")
-                    local_hash = protocol.calculate_file_hash(save_path)
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                    if response.get('mode') == 'delta':
+                        # Remonta num arquivo temporário a partir da cópia antiga
+                        temp_path = save_path + '.tmp'
+                        local_hash, literal_bytes = delta.receive_delta(
+                            sock, save_path, temp_path, response.get('block_size'))
+                        print(f"[DELTA] Received {literal_bytes/1024/1024:.2f} MB of new data.")
+                        if local_hash != server_hash:
+                            os.remove(temp_path)
+                            print("[DELTA] Rebuilt file does not match. Requesting full file...")
+                            request_file(sock, filename, use_delta=False)
+                            continue
+                        os.replace(temp_path, save_path)
+                    else:
+                        protocol.receive_file_content(sock, save_path, filesize)
+
+                        # Verifica integridade do arquivo baixado
+                        print("[VERIFYING] Calculating SHA-256...")
+                        local_hash = protocol.calculate_file_hash(save_path)
 
                     print(f"Local Hash: {local_hash}")
                     print(f"Received Hash: {server_hash}")
@@ -103,7 +241,11 @@ def main():
     print("\n--- COMMANDS ---")
     print("1. Chat [message]")
     print("2. File [filename]")
-    print("3. Exit")
+    print("3. Put [path]")
+    print("4. List")
+    print("5. Sync")
+    print("6. Stats")
+    print("7. Exit")
     print("----------------")
 
     while not stop_event.is_set():
@@ -115,7 +257,7 @@ def main():
 
             # Comando para sair
             if cmd == "exit":
-                protocol.send_json(c, {"type": "EXIT"})
+                send_message(c, {"type": "EXIT"})
                 stop_event.set()
                 break
 
@@ -125,7 +267,26 @@ def main():
                     print("Usage: Chat [message]")
                     continue
                 msg = parts[1]
-                protocol.send_json(c, {"type": "CHAT", "message": msg})
+                send_message(c, {"type": "CHAT", "message": msg})
+
+            # Comando para enviar um arquivo ao servidor
+            elif cmd == "put":
+                if len(parts) < 2 or not os.path.isfile(parts[1]):
+                    print("Usage: Put [path to an existing file]")
+                    continue
+                start_upload(c, parts[1])
+
+            # Comando para listar os arquivos do servidor
+            elif cmd == "list":
+                send_message(c, {"type": "MANIFEST"})
+
+            # Comando para baixar todos os arquivos novos ou alterados
+            elif cmd == "sync":
+                send_message(c, {"type": "SYNC", "have": local_hashes()})
+
+            # Comando para pedir as métricas do servidor
+            elif cmd == "stats":
+                send_message(c, {"type": "STATS"})
 
             # Comando para solicitar arquivo
             elif cmd == "file":
@@ -133,13 +294,13 @@ def main():
                     print("Usage: File [filename.ext]")
                     continue
                 filename = parts[1]
-                protocol.send_json(c, {"type": "FILE_REQ", "filename": filename})
+                request_file(c, filename)
 
             else:
                 print("Unknown command.")
 
         except KeyboardInterrupt:
-            protocol.send_json(c, {"type": "EXIT"})
+            send_message(c, {"type": "EXIT"})
             break
         except Exception as e:
             print(f"Error sending data: {e}")
@@ -0,0 +1,213 @@
+import hashlib
+import math
+import mmap
+import zlib
+
+import protocol
+
+# Sincronização por delta no estilo rsync:
+# 1. O cliente divide sua cópia antiga em blocos de tamanho fixo e envia, para cada
+#    bloco, um checksum fraco (Adler-32, que pode ser "rolado" byte a byte) e um forte (MD5).
+# 2. O servidor percorre o arquivo atual com uma janela do tamanho do bloco procurando
+#    blocos que o cliente já tem, e responde com instruções COPY (bloco já existente)
+#    e DATA (bytes literais novos).
+# 3. O cliente remonta o arquivo a partir da cópia antiga e dos literais.
+#
+# No fio, depois do FILE_META (com "mode": "delta"), cada instrução é um JSON:
+#   {"op": "COPY", "index": i, "count": k}  -> copiar k blocos a partir do bloco i
+#   {"op": "DATA", "length": n}             -> seguido de n bytes literais
+#   {"op": "END", "literal_bytes": x}       -> fim do arquivo
+
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 64 * 1024
+LITERAL_CHUNK = 64 * 1024  # Tamanho máximo de um DATA enviado de uma vez
+RESYNC_LIMIT = 16  # Blocos sem nenhum casamento antes de passar a testar só posições alinhadas
+ADLER_MOD = 65521
+
+#------------------------------------------------------------------------------
+
+def choose_block_size(filesize):
+    """Tamanho de bloco ~ raiz quadrada do arquivo, limitado a [2 KB, 64 KB]."""
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, math.isqrt(filesize)))
+
+#------------------------------------------------------------------------------
+
+def block_signatures(filepath, block_size):
+    """Retorna [checksum fraco, MD5 hex] de cada bloco do arquivo."""
+    signatures = []
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            signatures.append([zlib.adler32(block), hashlib.md5(block).hexdigest()])
+    return signatures
+
+#------------------------------------------------------------------------------
+
+def compute_delta(filepath, block_size, signatures, base_size):
+    """
+    Gera as instruções que transformam a cópia do cliente (com 'base_size' bytes)
+    no arquivo atual: ('COPY', índice, quantidade) para blocos que o cliente já tem
+    e ('DATA', bytes) para o conteúdo novo.
+    """
+    # Índice dos blocos do cliente pelo checksum fraco
+    table = {}
+    for index, (weak, strong) in enumerate(signatures):
+        table.setdefault(weak, []).append((index, strong))
+
+    # O último bloco do cliente pode ser menor que block_size; ele só casa no fim do arquivo
+    tail = None
+    if signatures and base_size % block_size:
+        tail = (len(signatures) - 1, base_size % block_size)
+
+    with open(filepath, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        yield from _scan(data, block_size, table, signatures, tail)
+    finally:
+        data.close()
+
+#------------------------------------------------------------------------------
+
+def _match(data, start, size, weak, table):
+    """Retorna o índice do bloco do cliente igual a data[start:start+size], se houver."""
+    candidates = table.get(weak)
+    if not candidates:
+        return None
+    strong = hashlib.md5(data[start:start + size]).hexdigest()
+    for index, candidate in candidates:
+        if candidate == strong:
+            return index
+    return None
+
+
+def _scan(data, block_size, table, signatures, tail):
+    """Percorre o arquivo com a janela rolante e emite as instruções COPY/DATA."""
+    n = len(data)
+    pending = [0, 0]  # Cópia em aberto: [primeiro bloco, quantidade]
+
+    def copy(index):
+        # Junta cópias de blocos consecutivos numa só instrução
+        if pending[1] and pending[0] + pending[1] == index:
+            pending[1] += 1
+            return
+        if pending[1]:
+            yield ('COPY', pending[0], pending[1])
+        pending[0], pending[1] = index, 1
+
+    def literal(start, end):
+        if start >= end:
+            return
+        if pending[1]:
+            yield ('COPY', pending[0], pending[1])
+            pending[1] = 0
+        for i in range(start, end, LITERAL_CHUNK):
+            yield ('DATA', data[i:min(i + LITERAL_CHUNK, end)])
+
+    def window(start):
+        weak = zlib.adler32(data[start:start + block_size])
+        return weak & 0xffff, weak >> 16
+
+    pos = 0
+    literal_start = 0
+    skips = 0
+    roll_until = 0
+    if n >= block_size:
+        a, b = window(0)
+
+    while pos + block_size <= n:
+        index = _match(data, pos, block_size, (b << 16) | a, table)
+        if index is not None and (tail is None or index != tail[0]):
+            yield from literal(literal_start, pos)
+            yield from copy(index)
+            pos += block_size
+            literal_start = pos
+            if pos + block_size <= n:
+                a, b = window(pos)
+            continue
+
+        if pos - literal_start >= RESYNC_LIMIT * block_size and pos >= roll_until:
+            # Trecho longo sem casamentos (arquivo muito diferente): rolar byte a byte em
+            # Python ficaria lento demais, então pula de bloco em bloco e, a cada
+            # RESYNC_LIMIT saltos, rola a janela por um bloco inteiro para reencontrar
+            # blocos deslocados
+            skips += 1
+            pos += block_size
+            if skips % RESYNC_LIMIT == 0:
+                roll_until = pos + block_size
+            if pos + block_size <= n:
+                a, b = window(pos)
+            continue
+
+        # Rola a janela um byte: tira data[pos], inclui data[pos + block_size]
+        if pos + block_size < n:
+            out_byte, in_byte = data[pos], data[pos + block_size]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+        pos += 1
+
+    # O final do arquivo pode coincidir com o último bloco (curto) do cliente
+    end = n
+    if tail is not None:
+        tail_index, tail_size = tail
+        tail_start = n - tail_size
+        if tail_start >= literal_start:
+            tail_weak = zlib.adler32(data[tail_start:n])
+            if _match(data, tail_start, tail_size, tail_weak, {tail_weak: [(tail_index, signatures[tail_index][1])]}) is not None:
+                end = tail_start
+
+    yield from literal(literal_start, end)
+    if end < n:
+        yield from copy(tail[0])
+    if pending[1]:
+        yield ('COPY', pending[0], pending[1])
+
+#------------------------------------------------------------------------------
+
+def copy_blocks(base_file, block_size, index, count):
+    """Lê 'count' blocos da cópia antiga a partir do bloco 'index'."""
+    base_file.seek(index * block_size)
+    return base_file.read(count * block_size)
+
+#------------------------------------------------------------------------------
+
+def send_delta(sock, filepath, block_size, signatures, base_size):
+    """Envia as instruções do delta e retorna quantos bytes literais foram enviados."""
+    literal_bytes = 0
+    for op in compute_delta(filepath, block_size, signatures, base_size):
+        if op[0] == 'COPY':
+            protocol.send_json(sock, {"op": "COPY", "index": op[1], "count": op[2]})
+        else:
+            protocol.send_json(sock, {"op": "DATA", "length": len(op[1])})
+            sock.sendall(op[1])
+            literal_bytes += len(op[1])
+    protocol.send_json(sock, {"op": "END", "literal_bytes": literal_bytes})
+    return literal_bytes
+
+#------------------------------------------------------------------------------
+
+def receive_delta(sock, base_path, out_path, block_size):
+    """
+    Remonta o arquivo em 'out_path' a partir da cópia antiga e das instruções
+    recebidas. Retorna (SHA-256 do resultado, bytes literais recebidos).
+    """
+    sha256_hash = hashlib.sha256()
+    literal_bytes = 0
+    with open(base_path, 'rb') as base, open(out_path, 'wb') as out:
+        while True:
+            op = protocol.receive_json(sock)
+            if not op:
+                raise Exception("Socket closed during delta transfer")
+            if op['op'] == 'END':
+                break
+            if op['op'] == 'COPY':
+                data = copy_blocks(base, block_size, op['index'], op['count'])
+            else:
+                data = protocol.recv_all(sock, op['length'])
+                if data is None:
+                    raise Exception("Socket closed during delta transfer")
+                literal_bytes += len(data)
+            out.write(data)
+            sha256_hash.update(data)
+    return sha256_hash.hexdigest(), literal_bytes
@@ -1,6 +1,7 @@
 import struct
 import json
 import hashlib
+import asyncio
 
 # Constantes do protocolo
 HEADER_FORMAT = '!I'  # Ordem de bytes de rede (Big Endian), Unsigned Int
@@ -45,6 +46,26 @@ def recv_all(sock, n):
 
 #------------------------------------------------------------------------------
 
+async def send_json_async(writer, data_dict):
+    """Versão asyncio de send_json (escreve o quadro inteiro de uma vez)."""
+    json_data = json.dumps(data_dict).encode(ENC)
+    writer.write(struct.pack(HEADER_FORMAT, len(json_data)) + json_data)
+    await writer.drain()
+
+#------------------------------------------------------------------------------
+
+async def receive_json_async(reader):
+    """Versão asyncio de receive_json. Retorna None se a conexão foi fechada."""
+    try:
+        header_data = await reader.readexactly(HEADER_SIZE)
+        msg_length = struct.unpack(HEADER_FORMAT, header_data)[0]
+        payload_data = await reader.readexactly(msg_length)
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(payload_data.decode(ENC))
+
+#------------------------------------------------------------------------------
+
 def calculate_file_hash(filepath):
     """Calcula o SHA-256 de um arquivo."""
     sha256_hash = hashlib.sha256()
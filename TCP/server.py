@@ -1,19 +1,154 @@
 import socket
 import threading
+import hashlib
 import protocol
+import delta
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import file_index, log as logger, metrics
 
 
 # Configurações do servidor
 HOST = "0.0.0.0"
 PORT = 12345       
 FILES_DIR = "../server_files" # Pasta onde os arquivos ficam disponíveis para download
+UPLOAD_DIR = os.path.join(FILES_DIR, ".uploads")  # Uploads incompletos (para retomar)
+UPLOAD_CHUNK = 1024 * 1024  # Leituras e escritas grandes durante um upload
+
 
+log = logger.get_logger('tcp_server')
 
-# Lista de clientes conectados e lock para acesso concorrente
-clients = []
+# Clientes conectados (socket -> lock de envio) e lock para acesso concorrente.
+# O lock de envio impede que um broadcast do console se misture com uma
+# resposta (e.g., no meio do conteúdo de um arquivo) na mesma conexão.
+clients = {}
 clients_lock = threading.Lock()
 
+# Índice de FILES_DIR: tamanho, mtime e SHA-256 (calculado uma vez) de cada arquivo
+index = file_index.FileIndex(FILES_DIR)
+
+# Uploads em andamento, pelo SHA-256 esperado (cada um tem seu arquivo temporário)
+uploads_in_progress = set()
+uploads_lock = threading.Lock()
+
+# Métricas do servidor (consultadas pelo comando STATS)
+active_sessions = metrics.gauge('tcp_active_sessions')
+bytes_sent = metrics.counter('tcp_bytes_sent_total')
+chat_messages = metrics.counter('tcp_chat_messages_total')
+files_sent = metrics.counter('tcp_files_sent_total')
+files_not_found = metrics.counter('tcp_files_not_found_total')
+sync_files_skipped = metrics.counter('tcp_sync_files_skipped_total')
+delta_transfers = metrics.counter('tcp_delta_transfers_total')
+delta_bytes_saved = metrics.counter('tcp_delta_bytes_saved_total')
+bytes_received = metrics.counter('tcp_bytes_received_total')
+files_received = metrics.counter('tcp_files_received_total')
+upload_failures = metrics.counter('tcp_upload_failures_total')
+time_to_first_byte = metrics.histogram('tcp_time_to_first_byte_seconds')
+transfer_time = metrics.histogram('tcp_transfer_seconds')
+transfer_throughput = metrics.histogram('tcp_transfer_throughput_mb_per_second',
+                                        metrics.THROUGHPUT_BUCKETS)
+
+#------------------------------------------------------------------------------
+
+def build_manifest():
+    """Lista os arquivos de FILES_DIR (inclusive subpastas) com tamanho, mtime e SHA-256."""
+    return [{
+        "name": entry.name,
+        "size": entry.size,
+        "mtime": entry.mtime,
+        "sha256": index.digest(entry),
+    } for entry in index.entries()]
+
+#------------------------------------------------------------------------------
+
+def send_whole_file(conn, entry):
+    """Envia FILE_META seguido do conteúdo do arquivo e atualiza as métricas."""
+    protocol.send_json(conn, {
+        "type": "FILE_META",
+        "status": "OK",
+        "filename": entry.name,
+        "filesize": entry.size,
+        "sha256": index.digest(entry)
+    })
+    start = time.perf_counter()
+    index.sendfile(conn, entry)
+    elapsed = time.perf_counter() - start
+
+    bytes_sent.inc(entry.size)
+    files_sent.inc()
+    transfer_time.observe(elapsed)
+    if elapsed > 0:
+        transfer_throughput.observe(entry.size / elapsed / 1024 / 1024)
+
+#------------------------------------------------------------------------------
+
+def receive_upload(conn, send_lock, request):
+    """
+    Recebe um FILE_PUT: responde PUT_READY com o offset a partir do qual o cliente
+    deve enviar, grava os bytes num arquivo temporário calculando o SHA-256 durante
+    a recepção e, se o hash conferir, move o arquivo para o destino de uma vez.
+    Retorna (status, mensagem) para o PUT_RESULT.
+    """
+    filename = request.get('filename')
+    filesize = request.get('filesize')
+    expected_hash = request.get('sha256')
+    name = file_index.normalize_name(filename)
+    if name is None or not isinstance(filesize, int) or not expected_hash:
+        return "ERROR", "Invalid upload request."
+
+    with uploads_lock:
+        if expected_hash in uploads_in_progress:
+            return "ERROR", "Upload already in progress."
+        uploads_in_progress.add(expected_hash)
+
+    # O temporário é identificado pelo hash: uma conexão nova com o mesmo conteúdo retoma dele
+    temp_path = os.path.join(UPLOAD_DIR, expected_hash + '.part')
+    try:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+        if offset > filesize:
+            os.remove(temp_path)
+            offset = 0
+
+        # Retomando: o hash precisa incluir os bytes que já estavam gravados
+        sha256_hash = hashlib.sha256()
+        if offset:
+            with open(temp_path, 'rb') as f:
+                for block in iter(lambda: f.read(UPLOAD_CHUNK), b""):
+                    sha256_hash.update(block)
+
+        with send_lock:
+            protocol.send_json(conn, {"type": "PUT_READY", "filename": filename, "offset": offset})
+
+        received = offset
+        with open(temp_path, 'ab', buffering=UPLOAD_CHUNK) as f:
+            while received < filesize:
+                chunk = conn.recv(min(UPLOAD_CHUNK, filesize - received))
+                if not chunk:
+                    raise ConnectionError("Socket closed during upload")
+                f.write(chunk)
+                sha256_hash.update(chunk)
+                received += len(chunk)
+                bytes_received.inc(len(chunk))
+
+        if sha256_hash.hexdigest() != expected_hash:
+            os.remove(temp_path)
+            upload_failures.inc()
+            return "ERROR", "SHA-256 mismatch. Upload discarded."
+
+        filepath = os.path.join(FILES_DIR, *name.split('/'))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        os.replace(temp_path, filepath)
+        index.refresh(name, sha256=expected_hash)
+        files_received.inc()
+        return "OK", f"Stored {filename} ({filesize} bytes, resumed at {offset})."
+    finally:
+        with uploads_lock:
+            uploads_in_progress.discard(expected_hash)
+
 #------------------------------------------------------------------------------
 def handle_client(conn: socket.socket, addr):
     """
@@ -22,11 +157,12 @@ def handle_client(conn: socket.socket, addr):
     """
 
     # Exibe conexão estabelecida
-    print(f"[+] Connected: {addr}")
+    log.info("[+] Connected: %s", addr)
 
     # Adiciona cliente à lista protegida por lock
+    send_lock = threading.Lock()
     with clients_lock:
-        clients.append(conn)
+        clients[conn] = send_lock
 
     connected = True
     try:
@@ -40,49 +176,118 @@ def handle_client(conn: socket.socket, addr):
 
             # Cliente deseja desconectar
             if cmd == 'EXIT':
-                print(f"[DISCONNECT] Client {addr} requested exit.")
+                log.info("[DISCONNECT] Client %s requested exit.", addr)
                 connected = False
             
             # Mensagem de chat recebida
             elif cmd == 'CHAT':
                 msg = request.get('message')
-                print(f"[CHAT from {addr}]: {msg}")
+                chat_messages.inc()
+                log.info("[CHAT from %s]: %s", addr, msg)
+
+            # Cliente pede as métricas do servidor
+            elif cmd == 'STATS':
+                with send_lock:
+                    protocol.send_json(conn, {"type": "STATS", "metrics": metrics.snapshot()})
+
+            # Cliente pede a lista de arquivos disponíveis
+            elif cmd == 'MANIFEST':
+                manifest = build_manifest()
+                with send_lock:
+                    protocol.send_json(conn, {"type": "MANIFEST", "files": manifest})
+
+            # Cliente pede todos os arquivos que não tem (ou que mudaram), em sequência
+            elif cmd == 'SYNC':
+                have = request.get('have', {})
+                sent = skipped = 0
+                log.info("[SYNC] Client %s has %d files", addr, len(have))
+                for entry in index.entries():
+                    if have.get(entry.name) == index.digest(entry):
+                        skipped += 1
+                        continue
+                    with send_lock:
+                        send_whole_file(conn, entry)
+                    sent += 1
+                sync_files_skipped.inc(skipped)
+                with send_lock:
+                    protocol.send_json(conn, {"type": "SYNC_END", "sent": sent, "skipped": skipped})
+                log.info("[SYNC] Sent %d files to %s, %d up to date", sent, addr, skipped)
+
+            # Cliente envia um arquivo para o servidor
+            elif cmd == 'FILE_PUT':
+                log.info("[FILE_PUT] Client %s is uploading %s", addr, request.get('filename'))
+                status, message = receive_upload(conn, send_lock, request)
+                with send_lock:
+                    protocol.send_json(conn, {
+                        "type": "PUT_RESULT",
+                        "status": status,
+                        "filename": request.get('filename'),
+                        "message": message
+                    })
+                log.info("[FILE_PUT] %s from %s: %s", status, addr, message)
 
             # Cliente solicita arquivo
             elif cmd == 'FILE_REQ':
+                request_time = time.perf_counter()
                 filename = request.get('filename')
-                filepath = os.path.join(FILES_DIR, filename)
+                entry = index.lookup(filename)
 
-                print(f"[FILE_REQ] Client {addr} requested {filename}")
+                log.info("[FILE_REQ] Client %s requested %s", addr, filename)
 
                 # Verifica se arquivo existe e envia metadados + conteúdo
-                if os.path.exists(filepath) and os.path.isfile(filepath):
-                    filesize = os.path.getsize(filepath)
-                    filehash = protocol.calculate_file_hash(filepath)
+                if entry is not None:
+                    filesize = entry.size
+                    filehash = index.digest(entry)
                     
-                    protocol.send_json(conn, {
+                    meta = {
                         "type": "FILE_META",
                         "status": "OK",
                         "filename": filename,
                         "filesize": filesize,
                         "sha256": filehash
-                    })
-                    
-                    protocol.send_file(conn, filepath)
-                    print(f"[UPLOAD] Sent {filename} to {addr}")
+                    }
+
+                    # Cliente já tem uma cópia antiga: envia só o delta
+                    delta_req = request.get('delta')
+                    if delta_req:
+                        meta["mode"] = "delta"
+                        meta["block_size"] = delta_req['block_size']
+                    with send_lock:
+                        protocol.send_json(conn, meta)
+
+                        start = time.perf_counter()
+                        time_to_first_byte.observe(start - request_time)
+                        if delta_req:
+                            sent = delta.send_delta(conn, entry.path, delta_req['block_size'],
+                                                    delta_req['blocks'], delta_req['filesize'])
+                            delta_transfers.inc()
+                            delta_bytes_saved.inc(filesize - sent)
+                        else:
+                            index.sendfile(conn, entry)
+                            sent = filesize
+                    elapsed = time.perf_counter() - start
+
+                    bytes_sent.inc(sent)
+                    files_sent.inc()
+                    transfer_time.observe(elapsed)
+                    if elapsed > 0:
+                        transfer_throughput.observe(filesize / elapsed / 1024 / 1024)
+                    log.info("[UPLOAD] Sent %s to %s (%d of %d bytes)", filename, addr, sent, filesize)
                 else:
+                    files_not_found.inc()
                     # Arquivo não encontrado
-                    protocol.send_json(conn, {
-                        "type": "FILE_META",
-                        "status": "ERROR",
-                        "message": "File not found."
-                    })
+                    with send_lock:
+                        protocol.send_json(conn, {
+                            "type": "FILE_META",
+                            "status": "ERROR",
+                            "message": "File not found."
+                        })
     except Exception as e:
-        print(f"[!] Error with {addr}: {e}")
+        log.warning("[!] Error with %s: %s", addr, e)
     finally:
         with clients_lock:
-            if conn in clients:
-                clients.remove(conn)
+            clients.pop(conn, None)
+        active_sessions.dec()
         conn.close()
 
 #------------------------------------------------------------------------------
@@ -95,15 +300,19 @@ def server_console_thread():
     while True:
         msg = input()
         with clients_lock:
-            for client_conn in clients:
-                try:
+            targets = list(clients.items())
+        # Envia fora do clients_lock: um cliente no meio de uma transferência
+        # não deve travar as novas conexões
+        for client_conn, send_lock in targets:
+            try:
+                with send_lock:
                     protocol.send_json(client_conn, {
-                        "type": "CHAT", 
-                        "sender": "SERVER", 
+                        "type": "CHAT",
+                        "sender": "SERVER",
                         "message": msg
                     })
-                except:
-                    pass
+            except:
+                pass
 
 #------------------------------------------------------------------------------
 
@@ -111,11 +320,13 @@ def main():
     """
     Inicializa o servidor TCP, prepara diretório de arquivos e aceita conexões de clientes.
     """
+    logger.setup()
 
     # Cria diretório de arquivos se não existir
     if not os.path.exists(FILES_DIR):
         os.makedirs(FILES_DIR)
         print(f"Created directory '{FILES_DIR}'. Place files here to download.")
+    index.start()
 
     # Cria socket TCP e inicia escuta
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -129,9 +340,10 @@ def main():
     while True:
         # Aceita novas conexões de clientes
         conn, addr = s.accept()
+        active_sessions.inc()
         thread = threading.Thread(target=handle_client, args=(conn, addr))
         thread.start()
-        print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 2}")
+        log.info("[ACTIVE CONNECTIONS] %s", active_sessions.value)
 
 #------------------------------------------------------------------------------
 
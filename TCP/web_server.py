@@ -1,16 +1,51 @@
 import socket
 import threading
+import argparse
+import logging
+import queue
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import file_index, log as logger, metrics
 
 # Configurações do servidor
 HOST = "0.0.0.0"
 PORT = 8080
 FILES_DIR = "../server_files" # Pasta onde ficam o index.html e as imagens
+METRICS_PATH = "/metrics" # Rota com as métricas no formato do Prometheus
+
+# Pool de workers: as conexões aceitas esperam numa fila limitada; com a fila cheia
+# o servidor responde 503 na hora em vez de criar mais threads
+BACKLOG = 128  # Conexões pendentes no kernel (listen)
+WORKERS = 16  # Threads atendendo requisições
+QUEUE_SIZE = 64  # Conexões aceitas esperando um worker
+RETRY_AFTER = 1  # Segundos sugeridos ao cliente no 503
+REQUEST_TIMEOUT = 10.0  # Tempo máximo parado lendo/enviando antes de liberar o worker
+
+log = logger.get_logger('web_server')
+# Sob sobrecarga cada conexão rejeitada geraria um aviso; limita a um por segundo
+overload_warnings = logger.Throttle(log, level=logging.WARNING)
+
+# Índice de FILES_DIR: tamanho e MIME type de cada arquivo, e descritores já abertos
+index = file_index.FileIndex(FILES_DIR)
+
+# Métricas do servidor
+active_sessions = metrics.gauge('http_active_sessions')
+bytes_sent = metrics.counter('http_bytes_sent_total')
+time_to_first_byte = metrics.histogram('http_time_to_first_byte_seconds')
+request_time = metrics.histogram('http_request_seconds')
+queue_wait = metrics.histogram('http_queue_wait_seconds')
+queue_depth = metrics.gauge('http_queue_depth')
+rejected = metrics.counter('http_rejected_total')
+transfer_throughput = metrics.histogram('http_transfer_throughput_mb_per_second',
+                                        metrics.THROUGHPUT_BUCKETS)
 
 #------------------------------------------------------------------------------
-def build_http_response(status_code, content_type, content):
+def build_http_header(status_code, content_type, content_length, extra_headers=None):
     """
-    Constrói o cabeçalho HTTP e anexa o conteúdo binário.
+    Constrói o cabeçalho HTTP.
     Exemplo de Header:
     HTTP/1.0 200 OK
     Content-Type: text/html
@@ -22,40 +57,106 @@ def build_http_response(status_code, content_type, content):
         status_line = "HTTP/1.0 200 OK"
     elif status_code == 404:
         status_line = "HTTP/1.0 404 Not Found"
+    elif status_code == 503:
+        status_line = "HTTP/1.0 503 Service Unavailable"
     else:
         status_line = "HTTP/1.0 500 Internal Server Error"
 
     # Cabeçalhos
     header = f"{status_line}\r\n"
     header += f"Content-Type: {content_type}\r\n"
-    header += f"Content-Length: {len(content)}\r\n"
+    header += f"Content-Length: {content_length}\r\n"
+    for name, value in (extra_headers or {}).items():
+        header += f"{name}: {value}\r\n"
     header += "Connection: close\r\n" # Encerra conexão após enviar
     header += "\r\n" # Linha em branco obrigatória entre Header e Body
 
-    # Retorna cabeçalho codificado + conteúdo bruto
-    return header.encode('utf-8') + content
+    return header.encode('utf-8')
 
 #------------------------------------------------------------------------------
 
-def get_content_type(filename):
-    """Define o MIME type baseado na extensão do arquivo."""
-    if filename.endswith(".html") or filename.endswith(".htm"):
-        return "text/html"
-    elif filename.endswith(".jpg") or filename.endswith(".jpeg"):
-        return "image/jpeg"
-    elif filename.endswith(".png"):
-        return "image/png"
-    else:
-        return "application/octet-stream"
+def build_http_response(status_code, content_type, content, extra_headers=None):
+    """Constrói o cabeçalho HTTP e anexa o conteúdo binário."""
+    return build_http_header(status_code, content_type, len(content), extra_headers) + content
+
+#------------------------------------------------------------------------------
+
+def send_response(conn, status_code, content_type, content, start, extra_headers=None):
+    """Envia a resposta e registra status, bytes, TTFB e vazão nas métricas."""
+    response = build_http_response(status_code, content_type, content, extra_headers)
+    send_start = time.perf_counter()
+    time_to_first_byte.observe(send_start - start)
+    conn.sendall(response)
+    record_response(status_code, len(response), send_start)
 
 #------------------------------------------------------------------------------
 
-def handle_client(conn, addr):
+def send_file_response(conn, entry, start):
+    """Envia um arquivo do índice direto do descritor em cache (sendfile), sem lê-lo para a memória."""
+    header = build_http_header(200, entry.mime, entry.size)
+    send_start = time.perf_counter()
+    time_to_first_byte.observe(send_start - start)
+    conn.sendall(header)
+    index.sendfile(conn, entry)
+    record_response(200, len(header) + entry.size, send_start)
+
+#------------------------------------------------------------------------------
+
+def record_response(status_code, size, send_start):
+    """Registra status, bytes e vazão de uma resposta enviada."""
+    elapsed = time.perf_counter() - send_start
+    metrics.counter('http_responses_total', {'status': status_code}).inc()
+    bytes_sent.inc(size)
+    if elapsed > 0:
+        transfer_throughput.observe(size / elapsed / 1024 / 1024)
+
+#------------------------------------------------------------------------------
+
+def reject_overloaded(conn, start):
+    """Responde 503 com Retry-After quando a fila de conexões está cheia."""
+    rejected.inc()
+    body = b"<h1>503 - Servidor Ocupado</h1><p>Tente novamente em instantes.</p>"
+    try:
+        # Descarta o que já chegou da requisição: fechar com dados não lidos
+        # faz o kernel mandar RST, e o cliente poderia perder o 503
+        conn.setblocking(False)
+        try:
+            conn.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+        conn.settimeout(RETRY_AFTER)
+        send_response(conn, 503, "text/html", body, start, {"Retry-After": RETRY_AFTER})
+        conn.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+    finally:
+        request_time.observe(time.perf_counter() - start)
+        conn.close()
+
+#------------------------------------------------------------------------------
+
+def worker(accept_queue):
+    """Thread do pool: atende as conexões da fila uma de cada vez."""
+    while True:
+        conn, addr, accepted = accept_queue.get()
+        queue_wait.observe(time.perf_counter() - accepted)
+        queue_depth.set(accept_queue.qsize())
+        active_sessions.inc()
+        handle_client(conn, addr, accepted)
+
+#------------------------------------------------------------------------------
+
+def handle_client(conn, addr, start=None):
     """
     Função que lida com a requisição HTTP de um único cliente (Browser).
+    'start' é o instante em que a conexão foi aceita, para que a latência inclua a fila.
     """
+    if start is None:
+        start = time.perf_counter()
+    conn.settimeout(REQUEST_TIMEOUT)
+
     # Exibe conexão estabelecida
-    print(f"[+] Connected: {addr}")
+    log.info("[+] Connected: %s", addr)
 
     try:
         # Recebe a requisição
@@ -66,7 +167,7 @@ def handle_client(conn, addr):
 
         # Pegar apenas a primeira linha (Ex: GET /imagem.jpg HTTP/1.1)
         request_line = request_data.split('\r\n')[0]
-        print(f"[REQUEST] {addr} requested: {request_line}")
+        log.info("[REQUEST] %s requested: %s", addr, request_line)
 
         # Parse simples da string
         parts = request_line.split()
@@ -74,36 +175,38 @@ def handle_client(conn, addr):
             method = parts[0]  # GET
             path = parts[1]    # /index.html
             
+            # Rota de métricas
+            if path == METRICS_PATH:
+                send_response(conn, 200, "text/plain; version=0.0.4",
+                              metrics.render_prometheus().encode('utf-8'), start)
+                return
+
             # Se a rota for apenas "/", define para index.html
             if path == "/":
                 path = "/index.html"
             
-            # Remove a barra inicial para usar no caminho do SO
+            # Remove a barra inicial; o índice recusa caminhos fora de FILES_DIR
             filename = path.lstrip("/")
-            filepath = os.path.join(FILES_DIR, filename)
+            entry = index.lookup(filename)
 
             # Verifica se arquivo existe e processa
-            if os.path.exists(filepath) and os.path.isfile(filepath):
+            if entry is not None:
                 # -- CASO 200 OK --
-                with open(filepath, "rb") as f:
-                    file_content = f.read()
-                
-                content_type = get_content_type(filename)
-                response = build_http_response(200, content_type, file_content)
-                conn.sendall(response)
-                print(f"[SENT] 200 OK - {filename} ({len(file_content)} bytes)")
+                send_file_response(conn, entry, start)
+                log.info("[SENT] 200 OK - %s (%s bytes)", filename, entry.size)
             
             else:
                 # -- CASO 404 NOT FOUND --
                 error_msg = "<h1>404 - Arquivo Nao Encontrado</h1><p>O servidor nao encontrou o recurso.</p>"
-                response = build_http_response(404, "text/html", error_msg.encode('utf-8'))
-                conn.sendall(response)
-                print(f"[ERROR] 404 Not Found - {filename}")
+                send_response(conn, 404, "text/html", error_msg.encode('utf-8'), start)
+                log.warning("[ERROR] 404 Not Found - %s", filename)
 
     except Exception as e:
-        print(f"[EXCEPTION] Error processing the client {addr}: {e}")
+        log.warning("[EXCEPTION] Error processing the client %s: %s", addr, e)
     
     finally:
+        request_time.observe(time.perf_counter() - start)
+        active_sessions.dec()
         conn.close()
         # print(f"[END] Connection with {addr} ended.\n")
 
@@ -111,31 +214,54 @@ def handle_client(conn, addr):
 
 def main():
     """
-    Inicializa o servidor TCP Multithread.
+    Inicializa o servidor HTTP com um pool fixo de workers.
     """
+    parser = argparse.ArgumentParser(description="HTTP server for FILES_DIR.")
+    parser.add_argument('--backlog', type=int, default=BACKLOG,
+                        help="pending connections kept by the kernel (default %(default)s)")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="worker threads (default %(default)s)")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help="accepted connections waiting for a worker (default %(default)s)")
+    args = parser.parse_args()
+
+    logger.setup()
+
     # Cria diretório de arquivos se não existir
     if not os.path.exists(FILES_DIR):
         os.makedirs(FILES_DIR)
         print(f"Created directory '{FILES_DIR}'. Place HTML/JPEG files here.")
+    index.start()
 
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     
     server_socket.bind((HOST, PORT))
 
-    server_socket.listen(5)
+    server_socket.listen(args.backlog)
+
+    # Inicia o pool de workers
+    accept_queue = queue.Queue(maxsize=args.queue_size)
+    for _ in range(args.workers):
+        threading.Thread(target=worker, args=(accept_queue,), daemon=True).start()
+
     print(f"--- HTTP SERVER RUNNING ---")
     print(f"Access on the browser: http://localhost:{PORT}/index.html")
+    print(f"Workers: {args.workers}, queue: {args.queue_size}, backlog: {args.backlog}")
     print(f"Waiting for connections...\n")
 
     while True:
-        # Aceita conexão
+        # Aceita conexão e entrega para o pool; fila cheia = servidor sobrecarregado
         conn, addr = server_socket.accept()
-        
-        thread = threading.Thread(target=handle_client, args=(conn, addr))
-        thread.start()
-        
-        print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 1}")
+        accepted = time.perf_counter()
+        try:
+            accept_queue.put_nowait((conn, addr, accepted))
+        except queue.Full:
+            overload_warnings.log("[OVERLOAD] Queue full, rejecting %s", addr)
+            reject_overloaded(conn, accepted)
+            continue
+        queue_depth.set(accept_queue.qsize())
+        log.info("[ACTIVE CONNECTIONS] %s", active_sessions.value)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
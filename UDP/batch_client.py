@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import client
+
+DEFAULT_WORKERS = 4
+
+
+def negotiate_payloads(servers):
+    """Sonda o payload máximo de cada servidor uma vez só (None = padrão do servidor)."""
+    payloads = {}
+    for server_address in servers:
+        sock = client.create_socket()
+        try:
+            payloads[server_address] = client.probe_payload_size(sock, server_address)
+        finally:
+            sock.close()
+    return payloads
+
+
+def run_transfer(server_address, filename, payload_size, output_dir):
+    """Faz um download com socket e estado próprios e retorna o resultado dele."""
+    os.makedirs(output_dir, exist_ok=True)
+    sock = client.create_socket()
+    start = time.perf_counter()
+    try:
+        ok = client.download_file(sock, server_address, filename,
+                                  payload_size=payload_size, output_dir=output_dir)
+        error = None if ok else "transfer failed"
+    except OSError as e:
+        ok, error = False, str(e)
+    finally:
+        sock.close()
+    elapsed = time.perf_counter() - start
+
+    path = os.path.join(output_dir, f"received_{os.path.basename(filename)}")
+    size = os.path.getsize(path) if ok else 0
+    return {
+        "server": f"{server_address[0]}:{server_address[1]}",
+        "filename": filename,
+        "ok": ok,
+        "error": error,
+        "path": path if ok else None,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / elapsed / 1024 / 1024, 2) if ok and elapsed > 0 else None,
+    }
+
+
+def download_many(transfers, workers=DEFAULT_WORKERS, payload_size=None, output_dir='.'):
+    """
+    Baixa vários arquivos de um ou mais servidores UDP em paralelo. 'transfers' é
+    uma lista de (ip, porta, arquivo). Cada servidor grava numa subpasta
+    '<ip>_<porta>' de 'output_dir', para que arquivos de mesmo nome não colidam.
+    Retorna um resultado por transferência, na ordem pedida.
+    """
+    servers = list(dict.fromkeys((ip, port) for ip, port, _ in transfers))
+    if payload_size:
+        payloads = dict.fromkeys(servers, payload_size)
+    else:
+        payloads = negotiate_payloads(servers)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for ip, port, filename in transfers:
+            server_address = (ip, port)
+            server_dir = os.path.join(output_dir, f"{ip}_{port}")
+            futures.append(pool.submit(run_transfer, server_address, filename,
+                                       payloads[server_address], server_dir))
+        return [future.result() for future in futures]
+
+
+def main():
+    """Baixa uma lista de arquivos sem prompts e relata cada transferência."""
+    parser = argparse.ArgumentParser(description="Download many files from UDP servers at once.")
+    parser.add_argument('addresses', nargs='*', metavar='@IP:Port/file')
+    parser.add_argument('--list', help="file with one @IP:Port/file address per line")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="simultaneous transfers (default %(default)s)")
+    parser.add_argument('--payload', type=int, help="payload size; skips the MTU probe")
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--verbose', action='store_true', help="show each transfer's log")
+    args = parser.parse_args()
+
+    addresses = list(args.addresses)
+    if args.list:
+        with open(args.list) as f:
+            addresses += [line.strip() for line in f if line.strip()]
+    if not addresses:
+        parser.error("no files to download")
+
+    transfers = []
+    for address in addresses:
+        server_ip, server_port, filename = client.parse_address(address)
+        if server_ip is None:
+            parser.error(f"invalid address '{address}', use '@IP:Port/file'")
+        transfers.append((server_ip, server_port, filename))
+
+    # Os logs de várias transferências ao mesmo tempo se misturam; por padrão só avisos
+    client.logger.setup(quiet=not args.verbose)
+
+    start = time.perf_counter()
+    results = download_many(transfers, args.workers, args.payload, args.output_dir)
+    elapsed = time.perf_counter() - start
+    failures = sum(not result['ok'] for result in results)
+
+    if args.json:
+        print(json.dumps({"elapsed": round(elapsed, 3), "transfers": results}))
+    else:
+        print(f"{'status':>6} {'seconds':>8} {'MB/s':>7}  transfer")
+        for result in results:
+            status = 'OK' if result['ok'] else 'FAILED'
+            rate = result['mb_per_second'] if result['mb_per_second'] is not None else '-'
+            print(f"{status:>6} {result['seconds']:>8} {rate:>7}  "
+                  f"{result['server']}/{result['filename']}")
+        print(f"{len(results) - failures}/{len(results)} files in {elapsed:.2f}s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
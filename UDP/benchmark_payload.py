@@ -0,0 +1,67 @@
+import math
+import os
+import sys
+import time
+
+import client
+
+DEFAULT_SIZES = [512, 1400, 4096, 8947, 16384, 32768, 65482]
+REPETITIONS = 3
+
+
+def run_transfer(server_address, filename, payload_size):
+    """Faz um download completo com o payload dado e retorna (segundos, bytes)."""
+    sock = client.create_socket()
+    try:
+        start = time.perf_counter()
+        ok = client.download_file(
+            sock, server_address, filename, payload_size=payload_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        sock.close()
+
+    output_filename = f"received_{os.path.basename(filename)}"
+    if not ok:
+        raise RuntimeError(f"Transferência com payload {payload_size} falhou")
+    size = os.path.getsize(output_filename)
+    os.remove(output_filename)
+    return elapsed, size
+
+
+def main():
+    """Mede a vazão do servidor UDP para vários tamanhos de payload."""
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark_payload.py @IP:Port/arquivo [payload ...]")
+        print("Example: python benchmark_payload.py @127.0.0.1:9999/video_teste.mp4 1400 8947 65482")
+        return
+
+    server_ip, server_port, filename = client.parse_address(sys.argv[1])
+    if server_ip is None:
+        print("Formato invalido. Por favor use este formato: '@IP:Port/arquivo'.")
+        return
+    server_address = (server_ip, server_port)
+    # Silencia o log do cliente para não medir o terminal
+    client.logger.setup(quiet=True)
+    sizes = [int(x) for x in sys.argv[2:]] or DEFAULT_SIZES
+
+    probe_sock = client.create_socket()
+    probed = client.probe_payload_size(probe_sock, server_address)
+    probe_sock.close()
+    print(f"Payload máximo sondado: {probed} bytes")
+
+    print(f"\n{'payload':>8} {'pacotes':>9} {'tempo (s)':>10} {'MB/s':>8}")
+    for payload_size in sizes:
+        if probed and payload_size > probed:
+            print(f"{payload_size:>8} {'-':>9} {'-':>10} {'(não passa pelo caminho)':>8}")
+            continue
+        times = []
+        for _ in range(REPETITIONS):
+            elapsed, size = run_transfer(server_address, filename, payload_size)
+            times.append(elapsed)
+        best = min(times)
+        packets = math.ceil(size / payload_size)
+        print(f"{payload_size:>8} {packets:>9} {best:>10.3f} {size / best / 1024 / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
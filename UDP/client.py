@@ -2,10 +2,26 @@ import socket
 import struct
 import hashlib
 import re
-
-BUFFER_SIZE = 2048
+import select
+import os
+import json
+import time
+import zlib
+import base64
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import log as logger
+
+BUFFER_SIZE = 65535
+RCVBUF_SIZE = 4 * 1024 * 1024  # Buffer do socket, para absorver bursts grandes
 NACK_BATCH_SIZE = 150
 MAX_NACK_ATTEMPS = 5
+INFO_TIMEOUT = 20.0  # Tempo máximo esperando o INFO do servidor
+REQ_RETRY_INTERVAL = 2.0  # Intervalo para repetir a requisição sem resposta
+STATE_SAVE_INTERVAL = 1.0  # Intervalo (s) entre gravações do estado durante um burst
+
+log = logger.get_logger('udp_client')
 
 # --- Tipos de mensagens de protocolo ---
 REQ = 0
@@ -15,11 +31,24 @@ INFO = 3
 ERR = 4
 ACK = 5
 BUSY = 6
+PROBE = 7
+STATS = 8
+
+# --- Sondagem de MTU ---
+# Tamanhos de datagrama (payload UDP) testados, do maior para o menor:
+# loopback, jumbo frames (9000), Ethernet (1500), túneis e o mínimo do IPv6
+PROBE_SIZES = [65507, 32768, 16384, 8972, 4096, 1472, 1400, 1232]
+PROBE_TIMEOUT = 0.3
+PROBE_RETRIES = 2
 
 # --- Formato do Header ---
 HEADER_FORMAT = '!II16sB'
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 
+# --- Formato do payload do INFO (MD5, tamanho, mtime, payload por segmento) ---
+INFO_FORMAT = '!16sQdI'
+INFO_SIZE = struct.calcsize(INFO_FORMAT)
+
 
 def create_header(seq_num, total_segments, checksum, msg_type):
     """Empacota os campos do header em um objeto bytes."""
@@ -36,6 +65,91 @@ def calculate_md5(data):
     return hashlib.md5(data).digest()
 
 
+def open_multicast_socket(group_spec):
+    """
+    Entra no grupo multicast anunciado pelo servidor ('IP:Port').
+    Retorna None se o multicast não estiver disponível nesta máquina/rede.
+    """
+    try:
+        group, port = group_spec.rsplit(':', 1)
+        msock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        msock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        msock.bind(('', int(port)))
+        mreq = struct.pack('4s4s', socket.inet_aton(group),
+                           socket.inet_aton('0.0.0.0'))
+        msock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        return msock
+    except (OSError, ValueError) as e:
+        log.warning("Multicast indisponível (%s). Usando apenas unicast.", e)
+        return None
+
+
+def receive_packet(sockets, timeout):
+    """Recebe o próximo pacote de qualquer um dos sockets (levanta socket.timeout)."""
+    ready, _, _ = select.select(sockets, [], [], timeout)
+    if not ready:
+        raise socket.timeout()
+    packet, _ = ready[0].recvfrom(BUFFER_SIZE)
+    return packet
+
+
+def create_socket():
+    """Cria o socket UDP do cliente, proibindo fragmentação quando suportado."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+    # Com o bit DF ligado, um datagrama grande demais falha em vez de fragmentar
+    if hasattr(socket, 'IP_MTU_DISCOVER'):
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MTU_DISCOVER,
+                        socket.IP_PMTUDISC_DO)
+    return sock
+
+
+def probe_payload_size(sock, server_address):
+    """
+    Descobre o maior datagrama que chega ao servidor e volta sem se perder.
+    Retorna o tamanho de payload correspondente, ou None se nenhuma sonda voltar.
+    """
+    for size in PROBE_SIZES:
+        probe = create_header(size, 0, b'\x00'*16, PROBE) + bytes(size - HEADER_SIZE)
+        for _ in range(PROBE_RETRIES):
+            try:
+                sock.sendto(probe, server_address)
+            except OSError:
+                # EMSGSIZE: maior que o MTU conhecido do caminho
+                break
+            deadline = time.monotonic() + PROBE_TIMEOUT
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    sock.settimeout(remaining)
+                    reply, _ = sock.recvfrom(BUFFER_SIZE)
+                    seq_num, _, _, msg_type = unpack_header(reply)
+                    if msg_type == PROBE and seq_num == size and len(reply) == size:
+                        return size - HEADER_SIZE
+            except socket.timeout:
+                continue
+    return None
+
+
+def request_stats(sock, server_address, timeout=2.0):
+    """Pede as métricas do servidor (mensagem STATS) e retorna o dicionário, ou None."""
+    sock.sendto(create_header(0, 0, b'\x00'*16, STATS), server_address)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        sock.settimeout(remaining)
+        try:
+            reply, _ = sock.recvfrom(BUFFER_SIZE)
+        except socket.timeout:
+            return None
+        if unpack_header(reply)[3] == STATS:
+            return json.loads(reply[HEADER_SIZE:].decode())
+
+
 def parse_address(user_input):
     """Processa entradas como '@127.0.0.1:9999/arquivo.txt'."""
     match = re.match(r"@([\d\.]+):(\d+)/(.+)", user_input)
@@ -44,10 +158,295 @@ def parse_address(user_input):
     return None, None, None
 
 
+def encode_ranges(seqs):
+    """Compacta uma lista ordenada de segmentos em itens de NACK ("3", "10-20")."""
+    items = []
+    start = prev = None
+    for seq in seqs:
+        if start is None:
+            start = prev = seq
+        elif seq == prev + 1:
+            prev = seq
+        else:
+            items.append(str(start) if start == prev else f"{start}-{prev}")
+            start = prev = seq
+    if start is not None:
+        items.append(str(start) if start == prev else f"{start}-{prev}")
+    return items
+
+
+def send_nacks(sock, server_address, received):
+    """Envia NACKs (em lotes) com as faixas de segmentos ainda não recebidos."""
+    missing = encode_ranges(i for i, ok in enumerate(received) if not ok)
+    for i in range(0, len(missing), NACK_BATCH_SIZE):
+        batch = missing[i:i + NACK_BATCH_SIZE]
+        nack_payload = ",".join(batch).encode()
+        nack_header = create_header(0, 0, b'\x00'*16, NACK)
+
+        log.info("-- Solicitando lote de %s faixas começando por %s", len(batch), batch[0])
+        sock.sendto(nack_header + nack_payload, server_address)
+
+
+def load_state(state_path):
+    """Lê o estado salvo de um download interrompido (ou None se não houver)."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        state['received'] = bytearray(
+            zlib.decompress(base64.b64decode(state['received'])))
+        return state
+    except (OSError, ValueError, KeyError, zlib.error):
+        return None
+
+
+def save_state(state_path, info, received):
+    """Grava atomicamente o mapa de segmentos recebidos e os metadados do INFO."""
+    state = dict(info)
+    state['received'] = base64.b64encode(
+        zlib.compress(bytes(received))).decode()
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def file_md5(path):
+    """Calcula o hash MD5 de um arquivo em disco, em blocos."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(block)
+    return md5.digest()
+
+
+def download_file(sock, server_address, filename, packets_to_drop=None, payload_size=None,
+                  output_dir='.'):
+    """
+    Baixa um arquivo do servidor UDP, retomando um download anterior se houver
+    estado salvo. Os dados parciais ficam em 'received_<arquivo>.part' e o mapa de
+    segmentos recebidos em 'received_<arquivo>.state'. Retorna True em caso de sucesso.
+    'payload_size' é o tamanho de segmento pedido ao servidor (None usa o padrão dele)
+    e 'output_dir' é a pasta onde o arquivo e o estado são gravados.
+    """
+    packets_to_drop = set(packets_to_drop or ())
+    output_filename = os.path.join(
+        output_dir, f"received_{os.path.basename(filename)}")
+    part_path = output_filename + '.part'
+    state_path = output_filename + '.state'
+
+    saved_state = load_state(state_path)
+    if saved_state and not os.path.exists(part_path):
+        saved_state = None
+
+    # Faz a solicitação do arquivo com header
+    request_payload = f"GET /{filename}"
+    if saved_state:
+        # Mantém o tamanho de segmento do download original, senão o estado não serve
+        request_payload += " RESUME"
+        payload_size = saved_state.get('payload_size', payload_size)
+    if payload_size:
+        request_payload += f" PAYLOAD={payload_size}"
+    request_packet = create_header(0, 0, b'\x00'*16, REQ) + request_payload.encode()
+    sock.sendto(request_packet, server_address)
+    log.info("Solicitando arquivo '%s' de %s...", filename, server_address)
+
+    # Espera o pacote de informações, repetindo a requisição caso ela (ou o INFO) se perca
+    deadline = time.monotonic() + INFO_TIMEOUT
+    queued = False
+    while True:
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout()
+            sock.settimeout(remaining if queued else min(remaining, REQ_RETRY_INTERVAL))
+            try:
+                info_packet, _ = sock.recvfrom(BUFFER_SIZE)
+            except socket.timeout:
+                if time.monotonic() >= deadline:
+                    raise
+                sock.sendto(request_packet, server_address)
+                continue
+            _, total_segments, _, msg_type = unpack_header(info_packet)
+
+            if msg_type != INFO:
+                if msg_type == ERR:
+                    error_msg = info_packet[HEADER_SIZE:].decode()
+                    log.warning("Erro do servidor: %s", error_msg)
+                    return False
+                elif msg_type == BUSY:
+                    # Na fila do servidor: não adianta repetir a requisição
+                    log.info("Esperando liberar servidor...")
+                    queued = True
+                elif msg_type == DATA:
+                    # O INFO se perdeu mas os dados já estão chegando: pede o INFO de novo
+                    sock.sendto(request_packet, server_address)
+                continue
+
+            info_payload = info_packet[HEADER_SIZE:]
+            full_file_md5, file_size, file_mtime, payload_size = struct.unpack(
+                INFO_FORMAT, info_payload[:INFO_SIZE])
+            multicast_group = info_payload[INFO_SIZE:].decode()
+            log.info("Pacote de informação recebido:")
+            log.info("- Número esperado de segmentos: %s", total_segments)
+            log.info("- Payload por segmento: %s bytes", payload_size)
+            log.info("- Tamanho do arquivo: %.2f KB", file_size / 1024)
+            log.info("- Hash MD5 do arquivo: %s", full_file_md5.hex())
+            if multicast_group:
+                log.info("- Grupo multicast: %s", multicast_group)
+            break
+
+        except socket.timeout:
+            log.warning("Servidor não respondeu à tempo")
+            return False
+
+    info = {
+        'md5': full_file_md5.hex(),
+        'file_size': file_size,
+        'mtime': file_mtime,
+        'payload_size': payload_size,
+        'total_segments': total_segments,
+    }
+
+    # O estado salvo só vale se o arquivo no servidor não mudou
+    if saved_state and all(saved_state.get(k) == v for k, v in info.items()):
+        received = saved_state['received']
+        log.info("Retomando download: %s/%s segmentos já recebidos.", sum(received), total_segments)
+        part_file = open(part_path, 'r+b')
+    else:
+        if saved_state:
+            log.info("O arquivo mudou no servidor. Descartando o download parcial.")
+        received = bytearray(total_segments)
+        part_file = open(part_path, 'wb')
+        part_file.truncate(file_size)
+    save_state(state_path, info, received)
+
+    # Se o servidor transmite por multicast, escuta também o grupo
+    sockets = [sock]
+    multicast_sock = open_multicast_socket(
+        multicast_group) if multicast_group else None
+    if multicast_sock:
+        sockets.append(multicast_sock)
+
+    # Prepara para a recepção de pacotes
+    received_count = sum(received)
+    progress = logger.Progress(log, "segmentos recebidos", total_segments)
+    # Descartes por pacote podem se repetir muito num burst
+    discards = logger.Throttle(log)
+    nack_attemps = 0
+
+    # Ao retomar, o servidor não faz a passada completa: pede logo o que falta
+    if saved_state and received_count < total_segments:
+        send_nacks(sock, server_address, received)
+
+    try:
+        while received_count < total_segments:
+            log.info("--- Iniciando a recepção ---")
+
+            # Guarda o progresso
+            last_received_count = received_count
+            last_save = time.monotonic()
+
+            # Loop para receber um burst de pacotes
+            while True:
+                try:
+                    # Um timeout curto indica o fim do burst
+                    packet = receive_packet(sockets, 2.0)
+
+                    seq_num, packet_segments, checksum, msg_type = unpack_header(
+                        packet)
+
+                    # Descarta pacotes de outra transferência (e.g., no grupo multicast)
+                    if msg_type != DATA or packet_segments != total_segments:
+                        continue
+
+                    # Simulação de perda
+                    if seq_num in packets_to_drop:
+                        discards.log("Simulando perda do pacote %s", seq_num)
+                        packets_to_drop.remove(seq_num)
+                        continue
+
+                    # Check de integridade
+                    payload = packet[HEADER_SIZE:]
+                    if calculate_md5(payload) != checksum:
+                        discards.log("Pacote corrompido %s. Discartando.", seq_num)
+                        continue
+
+                    # Grava o pacote válido na sua posição do arquivo parcial
+                    if not received[seq_num]:
+                        part_file.seek(seq_num * payload_size)
+                        part_file.write(payload)
+                        received[seq_num] = 1
+                        received_count += 1
+
+                    progress.update(received_count)
+
+                    # Com todos os segmentos em mãos, não espera o fim do burst
+                    if received_count == total_segments:
+                        break
+
+                    # Persiste o progresso periodicamente
+                    if time.monotonic() - last_save > STATE_SAVE_INTERVAL:
+                        part_file.flush()
+                        save_state(state_path, info, received)
+                        last_save = time.monotonic()
+
+                except socket.timeout:
+                    log.info("Burst finalizado. Checando por segmentos faltantes...")
+                    break
+
+            part_file.flush()
+            save_state(state_path, info, received)
+
+            # Verifica se todos os pacotes foram recebidos
+            if received_count == total_segments:
+                log.info("Todos os segmentos foram recebidos! Verificando a integridade do arquivo...")
+                break
+
+            # Verifica se algum progresso foi feito desde o último NACK
+            if received_count == last_received_count:
+                nack_attemps += 1
+                log.info("Nenhum pacote novo recebido. Tentantiva número %s", nack_attemps)
+            else:
+                nack_attemps = 0
+
+            # Verifica se já fizemos o máximo de NACKS
+            if nack_attemps >= MAX_NACK_ATTEMPS:
+                log.warning('Servidor não está respondendo. Abortando transferência')
+                log.warning("Progresso salvo em '%s'. Tente novamente para retomar.", state_path)
+                return False
+
+            log.info("Número de segmentos faltantes: %s. Solicitando em lotes...",
+                     total_segments - received_count)
+            send_nacks(sock, server_address, received)
+            log.info("Todos os Nacks foram enviados para o servidor.")
+    finally:
+        part_file.close()
+        if multicast_sock:
+            multicast_sock.close()
+
+    # Verifica novamente a integridade e move o arquivo para o destino final
+    if file_md5(part_path) != full_file_md5:
+        log.warning("Verificação do arquivo falhou! Hashes MD5 não batem.")
+        os.remove(part_path)
+        os.remove(state_path)
+        return False
+
+    os.replace(part_path, output_filename)
+    os.remove(state_path)
+    log.info("Transferência do arquivo realizada com succeso! Salvo como '%s'.", output_filename)
+
+    # Envia o ACK final para o servidor
+    ack_header = create_header(0, 0, b'\x00'*16, ACK)
+    sock.sendto(ack_header, server_address)
+    log.info("ACK final enviado.")
+    return True
+
+
 def main():
     """Função main para rodar o cliente UDP"""
+    logger.setup()
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock = create_socket()
 
     # Recebe o endereço do servidor
     while True:
@@ -59,6 +458,13 @@ def main():
         print("Formato invalido. Por favor use este formato: '@IP:Port'.")
     server_address = (server_ip, server_port)
 
+    # Negocia o tamanho de segmento com base no maior datagrama que passa pelo caminho
+    payload_size = probe_payload_size(sock, server_address)
+    if payload_size:
+        print(f"Tamanho de payload negociado: {payload_size} bytes")
+    else:
+        print("Sondagem de MTU sem resposta. Usando o payload padrão do servidor.")
+
     while True:
         # Recebe nome do arquivo
         filename = input("Digite o nome do arquivo para baixar: ")
@@ -74,143 +480,7 @@ def main():
             except ValueError:
                 print("Entrada inválida. Nenhum pacote será perdido.")
 
-        # Faz a solicitação do arquivo com header
-        request_payload = f"GET /{filename}".encode()
-        request_header = create_header(0, 0, b'\x00'*16, REQ)
-        sock.sendto(request_header + request_payload, server_address)
-        print(f"\nSolicitando arquivo '{filename}' de {server_address}...")
-
-        # Espera o pacote de informações
-        while True:
-            try:
-                sock.settimeout(20.0)
-                info_packet, _ = sock.recvfrom(BUFFER_SIZE)
-                _, total_segments, _, msg_type = unpack_header(info_packet)
-
-                if msg_type != INFO:
-                    if msg_type == ERR:
-                        error_msg = info_packet[HEADER_SIZE:].decode()
-                        print(f"Erro do servidor: {error_msg}")
-                        return
-                    elif msg_type == BUSY:
-                        print("Esperando liberar servidor...")
-                        continue
-                    else:
-                        print(
-                            f"Erro no tipo de pacote recebido: {msg_type}. Abortando.")
-                    break
-
-                full_file_md5 = info_packet[HEADER_SIZE:]
-                print(f"Pacote de informação recebido:")
-                print(f"- Número esperado de segmentos: {total_segments}")
-                print(f"- Hash MD5 do arquivo: {full_file_md5.hex()}")
-                break
-
-            except socket.timeout:
-                print("Servidor não respondeu à tempo")
-                return
-        else:
-            continue
-
-        # Prepara para a recepção de pacotes
-        received_chunks = [None] * total_segments
-        received_count = 0
-        nack_attemps = 0
-
-        while received_count < total_segments:
-            print("\n--- Iniciando a recepção ---")
-
-            # Guarda o progresso
-            last_received_count = received_count
-
-            # Loop para receber um burst de pacotes
-            while True:
-                try:
-                    # Um timeout curto indica o fim do burst
-                    sock.settimeout(2.0)
-                    packet, _ = sock.recvfrom(BUFFER_SIZE)
-
-                    seq_num, _, checksum, msg_type = unpack_header(packet)
-
-                    if msg_type == DATA:
-                        # Simulação de perda
-                        if seq_num in packets_to_drop:
-                            print(f"Simulando perda do pacote {seq_num}")
-                            packets_to_drop.remove(seq_num)
-                            continue
-
-                        # Check de integridade
-                        payload = packet[HEADER_SIZE:]
-                        if calculate_md5(payload) != checksum:
-                            print(f"Pacote corrompido {seq_num}. Discartando.")
-                            continue
-
-                        # Guarda o pacote válido
-                        if received_chunks[seq_num] is None:
-                            received_chunks[seq_num] = payload
-                            received_count += 1
-
-                        print(
-                            f"\r{received_count}/{total_segments} segmentos recebidos", end="")
-
-                except socket.timeout:
-                    print("\nBurst finalizado. Checando por segmentos faltantes...")
-                    break
-
-            # Verifica se todos os pacotes foram recebidos
-            if received_count == total_segments:
-                print(
-                    "\nTodos os segmentos foram recebidos! Verificando a integridade do arquivo...")
-                break
-
-            # Identifica os segmentos faltantes e envia um NACK
-            missing_seqs = [str(i) for i, chunk in enumerate(
-                received_chunks) if chunk is None]
-            if missing_seqs:
-                # Verifica se algum progresso foi feito desde o último NACK
-                if received_count == last_received_count:
-                    nack_attemps += 1
-                    print(
-                        f"Nenhum pacote novo recebido. Tentantiva número {nack_attemps}")
-                else:
-                    nack_attemps = 0
-
-                # Verifica se já fizemos o máximo de NACKS
-                if nack_attemps >= MAX_NACK_ATTEMPS:
-                    print('Servidor não está respondendo. Abortando transferência')
-                    return
-
-                print(
-                    f"Número de segmentos faltantes: {len(missing_seqs)}. Solicitando em lotes...")
-
-                for i in range(0, len(missing_seqs), NACK_BATCH_SIZE):
-                    batch = missing_seqs[i:i + NACK_BATCH_SIZE]
-                    nack_payload = ",".join(batch).encode()
-                    nack_header = create_header(0, 0, b'\x00'*16, NACK)
-
-                    print(
-                        f"-- Solicitando lote de {len(batch)} segmentos começando por {batch[0]}")
-                    sock.sendto(nack_header + nack_payload, server_address)
-
-                print("Todos os Nacks foram enviados para o servidor.")
-
-        # Monta o arquivo
-        full_data = b"".join(received_chunks)
-
-        # Verifica novamente a integridade e escreve o resultado
-        if calculate_md5(full_data) == full_file_md5:
-            output_filename = f"received_{filename}"
-            with open(output_filename, 'wb') as f:
-                f.write(full_data)
-            print(
-                f"Transferência do arquivo realizada com succeso! Salvo como '{output_filename}'.")
-
-            # Envia o ACK final para o servidor
-            ack_header = create_header(0, 0, b'\x00'*16, ACK)
-            sock.sendto(ack_header, server_address)
-            print("ACK final enviado.")
-        else:
-            print("Verificação do arquivo falhou! Hashes MD5 não batem.")
+        download_file(sock, server_address, filename, packets_to_drop, payload_size)
 
         # Prompt para nova transferência
         again = input("Deseja baixar outro arquivo? (s/n): ").strip().lower()
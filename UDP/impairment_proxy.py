@@ -0,0 +1,200 @@
+import argparse
+import heapq
+import json
+import random
+import select
+import signal
+import socket
+import sys
+import time
+
+BUFFER_SIZE = 65535
+SESSION_TIMEOUT = 60.0  # Tempo sem tráfego antes de descartar a sessão de um cliente
+STATS_FIELDS = ('received', 'forwarded', 'lost', 'burst_lost', 'queue_dropped',
+                'duplicated', 'reordered')
+
+
+class Impairment:
+    """
+    Aplica as degradações de rede a um sentido do tráfego (cliente->servidor ou
+    servidor->cliente). Cada sentido tem seu próprio gerador aleatório com semente
+    fixa, então a mesma sequência de pacotes sofre sempre as mesmas perdas.
+    """
+
+    def __init__(self, args, seed):
+        self.rng = random.Random(seed)
+        self.loss = args.loss
+        self.burst_enter, self.burst_exit = args.burst_loss
+        self.in_burst = False
+        self.duplicate = args.duplicate
+        self.reorder = args.reorder
+        self.reorder_delay = args.reorder_delay / 1000
+        self.delay = args.delay / 1000
+        self.jitter = args.jitter / 1000
+        self.bytes_per_s = args.bandwidth * 1000 * 1000 / 8 if args.bandwidth else None
+        self.queue_limit = args.queue_limit
+        self.link_free_at = 0.0  # Instante em que o "enlace" termina o envio atual
+        self.stats = dict.fromkeys(STATS_FIELDS, 0)
+
+    def schedule(self, packet, now):
+        """
+        Decide o destino de um pacote: retorna a lista de instantes em que cópias
+        dele devem ser entregues (vazia se o pacote foi perdido).
+        """
+        self.stats['received'] += 1
+
+        # Perda em rajada (modelo de Gilbert-Elliott com dois estados)
+        if self.burst_enter:
+            if self.in_burst:
+                self.in_burst = self.rng.random() >= self.burst_exit
+            else:
+                self.in_burst = self.rng.random() < self.burst_enter
+            if self.in_burst:
+                self.stats['burst_lost'] += 1
+                return []
+
+        # Perda independente
+        if self.rng.random() < self.loss:
+            self.stats['lost'] += 1
+            return []
+
+        copies = 1
+        if self.rng.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+
+        deliveries = []
+        for _ in range(copies):
+            departure = now
+            # Limite de banda: cada pacote ocupa o enlace por len/taxa segundos
+            if self.bytes_per_s:
+                backlog = max(0.0, self.link_free_at - now) * self.bytes_per_s
+                if backlog + len(packet) > self.queue_limit:
+                    self.stats['queue_dropped'] += 1
+                    continue
+                departure = max(now, self.link_free_at) + len(packet) / self.bytes_per_s
+                self.link_free_at = departure
+
+            delay = self.delay
+            if self.jitter:
+                delay += self.rng.uniform(0, self.jitter)
+            # Reordenação: o pacote é segurado mais um pouco e ultrapassado pelos seguintes
+            if self.rng.random() < self.reorder:
+                self.stats['reordered'] += 1
+                delay += self.reorder_delay
+            deliveries.append(departure + delay)
+
+        self.stats['forwarded'] += len(deliveries)
+        return deliveries
+
+
+def parse_host_port(value):
+    """Converte 'IP:Port' em uma tupla de endereço."""
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def parse_burst(value):
+    """Converte 'p_entrar,p_sair' nas probabilidades do modelo de rajadas."""
+    enter, leave = (float(x) for x in value.split(','))
+    return enter, leave
+
+
+def main():
+    """Roda o relay UDP entre o cliente e o servidor, degradando o tráfego."""
+    parser = argparse.ArgumentParser(
+        description="UDP relay that injects loss, reordering, duplication, delay and "
+                    "bandwidth limits between UDP/client.py and UDP/server.py.")
+    parser.add_argument('--listen', type=parse_host_port, default=('127.0.0.1', 9000),
+                        help="address clients connect to (default 127.0.0.1:9000)")
+    parser.add_argument('--server', type=parse_host_port, default=('127.0.0.1', 9999),
+                        help="address of UDP/server.py (default 127.0.0.1:9999)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default 0)")
+    parser.add_argument('--loss', type=float, default=0.0, help="independent loss probability")
+    parser.add_argument('--burst-loss', type=parse_burst, default=(0.0, 1.0),
+                        metavar='ENTER,EXIT',
+                        help="probabilities of entering/leaving a burst in which every packet is lost")
+    parser.add_argument('--duplicate', type=float, default=0.0, help="duplication probability")
+    parser.add_argument('--reorder', type=float, default=0.0, help="reordering probability")
+    parser.add_argument('--reorder-delay', type=float, default=10.0,
+                        help="extra delay (ms) of reordered packets (default 10)")
+    parser.add_argument('--delay', type=float, default=0.0, help="one-way delay in ms")
+    parser.add_argument('--jitter', type=float, default=0.0, help="uniform random extra delay in ms")
+    parser.add_argument('--bandwidth', type=float, default=0.0, help="bandwidth cap in Mbit/s (0 = none)")
+    parser.add_argument('--queue-limit', type=int, default=256 * 1024,
+                        help="bytes queued at the bandwidth cap before tail drop (default 256 KiB)")
+    parser.add_argument('--direction', choices=('both', 'to-server', 'to-client'), default='both',
+                        help="which direction is impaired (default both)")
+    args = parser.parse_args()
+
+    clean = argparse.Namespace(**{**vars(args), 'loss': 0.0, 'burst_loss': (0.0, 1.0),
+                                  'duplicate': 0.0, 'reorder': 0.0, 'delay': 0.0,
+                                  'jitter': 0.0, 'bandwidth': 0.0})
+    to_server = Impairment(args if args.direction != 'to-client' else clean, args.seed)
+    to_client = Impairment(args if args.direction != 'to-server' else clean, args.seed + 1)
+
+    listen_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listen_sock.bind(args.listen)
+
+    # Cada cliente ganha um socket próprio para o servidor, que assim o vê como um endereço distinto
+    upstream_by_client = {}
+    client_by_upstream = {}
+    last_activity = {}
+    pending = []  # heap de (instante de entrega, contador, socket, pacote, destino)
+    counter = 0
+
+    def shutdown(*_):
+        print(json.dumps({"to_server": to_server.stats, "to_client": to_client.stats}), flush=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    print(f"Relay {args.listen[0]}:{args.listen[1]} -> {args.server[0]}:{args.server[1]} "
+          f"(seed {args.seed})", file=sys.stderr)
+
+    while True:
+        now = time.monotonic()
+        timeout = max(0.0, pending[0][0] - now) if pending else 1.0
+        readable, _, _ = select.select([listen_sock, *client_by_upstream], [], [], timeout)
+
+        now = time.monotonic()
+        for sock in readable:
+            packet, address = sock.recvfrom(BUFFER_SIZE)
+            if sock is listen_sock:
+                upstream = upstream_by_client.get(address)
+                if upstream is None:
+                    upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    upstream.connect(args.server)
+                    upstream_by_client[address] = upstream
+                    client_by_upstream[upstream] = address
+                last_activity[address] = now
+                for when in to_server.schedule(packet, now):
+                    heapq.heappush(pending, (when, counter, upstream, packet, args.server))
+                    counter += 1
+            else:
+                client_address = client_by_upstream[sock]
+                last_activity[client_address] = now
+                for when in to_client.schedule(packet, now):
+                    heapq.heappush(pending, (when, counter, listen_sock, packet, client_address))
+                    counter += 1
+
+        # Entrega tudo cujo instante já chegou
+        while pending and pending[0][0] <= now:
+            _, _, sock, packet, destination = heapq.heappop(pending)
+            try:
+                sock.sendto(packet, destination)
+            except OSError:
+                pass
+
+        # Descarta sessões ociosas
+        for address, seen in list(last_activity.items()):
+            if now - seen > SESSION_TIMEOUT:
+                upstream = upstream_by_client.pop(address)
+                del client_by_upstream[upstream]
+                del last_activity[address]
+                upstream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,29 @@ import os
 import hashlib
 import struct
 import math
+import time
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import file_index, log as logger, metrics
 
 HOST = '0.0.0.0'
 PORT = 9999
-BUFFER_SIZE = 2048
-PAYLOAD_SIZE = 1400  # MTU = 1500 bytes
+FILES_DIR = "../server_files"  # Pasta onde os arquivos ficam disponíveis para download
+BUFFER_SIZE = 65535
+PAYLOAD_SIZE = 1400  # MTU = 1500 bytes (padrão quando o cliente não negocia)
+MIN_PAYLOAD_SIZE = 512
+MAX_PAYLOAD_SIZE = 65507 - 25  # Maior datagrama UDP/IPv4 menos o header
+CLIENT_TIMEOUT = 10.0  # Tempo sem notícias de um cliente antes de descartá-lo
+COALESCE_WINDOW = 0.2  # Janela para juntar requisições do mesmo arquivo
+
+# --- Multicast (opcional) ---
+# Se MULTICAST_GROUP estiver definido, a passada de dados é enviada uma única vez
+# para o grupo, e cada cliente recupera o que perdeu via NACK (unicast).
+MULTICAST_GROUP = None  # e.g., '239.255.0.1'
+MULTICAST_PORT = 9998
+MULTICAST_TTL = 1
 
 # --- Tipos de mensagens de protocolo ---
 REQ = 0
@@ -17,6 +35,8 @@ INFO = 3
 ERR = 4
 ACK = 5
 BUSY = 6
+PROBE = 7
+STATS = 8
 
 # --- Formato do Header ---
 # !   = Ordenação big-endian para rede
@@ -27,6 +47,36 @@ BUSY = 6
 HEADER_FORMAT = '!II16sB'
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)  # 25 Bytes
 
+# --- Formato do payload do INFO ---
+# 16s = string de 16 bytes              - Hash MD5 do arquivo inteiro
+# Q   = unsigned long long (8 bytes)    - Tamanho do arquivo
+# d   = double (8 bytes)                - mtime do arquivo
+# I   = unsigned int (4 bytes)          - Tamanho do payload de cada segmento
+# Seguido opcionalmente do grupo multicast ('IP:Port')
+INFO_FORMAT = '!16sQdI'
+INFO_SIZE = struct.calcsize(INFO_FORMAT)  # 36 Bytes
+
+log = logger.get_logger('udp_server')
+# Avisos que podem se repetir a cada pacote são limitados a um por segundo
+ignored_packets = logger.Throttle(log)
+
+# Índice de FILES_DIR: tamanho, mtime e MD5 (calculado uma vez) de cada arquivo
+index = file_index.FileIndex(FILES_DIR)
+
+# --- Métricas do servidor (consultadas com uma mensagem STATS) ---
+active_sessions = metrics.gauge('udp_active_sessions')
+queue_depth = metrics.gauge('udp_queue_depth')
+bytes_sent = metrics.counter('udp_bytes_sent_total')
+segments_sent = metrics.counter('udp_segments_sent_total')
+segments_retransmitted = metrics.counter('udp_segments_retransmitted_total')
+nacks_received = metrics.counter('udp_nacks_received_total')
+transfers_completed = metrics.counter('udp_transfers_completed_total')
+transfers_expired = metrics.counter('udp_transfers_expired_total')
+time_to_first_byte = metrics.histogram('udp_time_to_first_byte_seconds')
+transfer_time = metrics.histogram('udp_transfer_seconds')
+transfer_throughput = metrics.histogram('udp_transfer_throughput_mb_per_second',
+                                        metrics.THROUGHPUT_BUCKETS)
+
 
 def create_header(seq_num, total_segments, checksum, msg_type):
     """Empacota os campos do header em um objeto de bytes."""
@@ -43,141 +93,349 @@ def calculate_md5(data):
     return hashlib.md5(data).digest()
 
 
+
+
+def parse_request(packet):
+    """
+    Interpreta uma requisição no formato "GET /filename.ext [OPÇÕES...]".
+    Retorna o nome do arquivo (ou None se inválida) e o conjunto de opções.
+    """
+    try:
+        _, _, _, msg_type = unpack_header(packet)
+        parts = packet[HEADER_SIZE:].decode().strip().split(' ')
+    except (struct.error, UnicodeDecodeError):
+        return None, set()
+    if msg_type != REQ or len(parts) < 2 or not parts[1].startswith('/'):
+        return None, set()
+    return parts[1][1:], set(parts[2:])
+
+
+def negotiated_payload_size(options):
+    """Lê a opção PAYLOAD=<n> da requisição, limitada aos valores suportados."""
+    for option in options:
+        if option.startswith('PAYLOAD='):
+            try:
+                size = int(option.split('=', 1)[1])
+            except ValueError:
+                break
+            return max(MIN_PAYLOAD_SIZE, min(size, MAX_PAYLOAD_SIZE))
+    return PAYLOAD_SIZE
+
+
+def answer_probe(sock, packet, address):
+    """
+    Responde a uma sonda de MTU ecoando um datagrama do mesmo tamanho, para que
+    o caminho seja testado nos dois sentidos.
+    """
+    sock.sendto(create_header(len(packet), 0, b'\x00'*16, PROBE) +
+                bytes(len(packet) - HEADER_SIZE), address)
+
+
+def parse_nack(payload):
+    """Converte o payload de um NACK ("3,7,10-20") na lista de segmentos pedidos."""
+    missing_seqs = []
+    for item in payload.decode().split(','):
+        if '-' in item:
+            first, last = item.split('-')
+            missing_seqs.extend(range(int(first), int(last) + 1))
+        else:
+            missing_seqs.append(int(item))
+    return missing_seqs
+
+
+def build_data_packet(file_content, seq_num, total_segments, payload_size):
+    """Monta o pacote DATA (header + chunk) de um segmento do arquivo."""
+    start = seq_num * payload_size
+    chunk = file_content[start:start + payload_size]
+    return create_header(seq_num, total_segments, calculate_md5(chunk), DATA) + chunk
+
+
+def send_busy(sock, address):
+    """Avisa um cliente que ele foi colocado na fila de espera."""
+    wait_header = create_header(0, 0, b'\x00'*16, BUSY)
+    wait_msg = b"Servidor ocupado, aguarde..."
+    sock.sendto(wait_header + wait_msg, address)
+
+
+def handle_control(sock, packet, address):
+    """
+    Atende mensagens que não fazem parte de uma transferência (sonda de MTU e
+    pedido de métricas). Retorna True se o pacote era uma delas.
+    """
+    if len(packet) < HEADER_SIZE:
+        return False
+    msg_type = packet[HEADER_SIZE - 1]
+    if msg_type == PROBE:
+        answer_probe(sock, packet, address)
+        return True
+    if msg_type == STATS:
+        stats = json.dumps(metrics.snapshot()).encode()
+        sock.sendto(create_header(0, 0, b'\x00'*16, STATS) + stats, address)
+        return True
+    return False
+
+
+def gather_requests(sock, waiting_clients, window):
+    """
+    Acumula na fila as requisições que chegarem durante uma janela curta, para
+    que pedidos simultâneos do mesmo arquivo caiam na mesma transmissão.
+    """
+    deadline = time.monotonic() + window
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        sock.settimeout(remaining)
+        try:
+            request, address = sock.recvfrom(BUFFER_SIZE)
+        except socket.timeout:
+            break
+        if handle_control(sock, request, address):
+            continue
+        if parse_request(request)[0] is not None:
+            waiting_clients.append((request, address))
+
+
+def collect_subscribers(filename, payload_size, client_address, waiting_clients):
+    """
+    Agrupa todos os clientes da fila que pediram o mesmo arquivo com o mesmo
+    tamanho de payload, para que sejam atendidos por uma única passada de
+    transmissão. Retorna também os clientes que estão retomando um download e
+    só querem os segmentos faltantes.
+    """
+    subscribers = [client_address]
+    resuming = set()
+    remaining = []
+    for request, address in waiting_clients:
+        requested, options = parse_request(request)
+        if requested == filename and negotiated_payload_size(options) == payload_size:
+            if address not in subscribers:
+                subscribers.append(address)
+            if 'RESUME' in options:
+                resuming.add(address)
+        else:
+            remaining.append((request, address))
+    waiting_clients[:] = remaining
+    return subscribers, resuming
+
+
+def serve_file(sock, filename, entry, payload_size, subscribers, resuming, waiting_clients,
+               request_time):
+    """
+    Transmite um arquivo para todos os inscritos de uma vez e depois atende os
+    NACKs de cada cliente individualmente até que todos confirmem (ACK) ou expirem.
+    Clientes retomando um download ficam fora da passada e pedem só o que falta.
+    'request_time' é o instante (perf_counter) em que a requisição chegou e 'entry'
+    é a entrada do arquivo no índice.
+    """
+    # Lê o arquivo pelo descritor em cache; o MD5 só é calculado na primeira vez
+    file_content = index.read(entry)
+    file_mtime = entry.mtime
+
+    file_size = len(file_content)
+    total_segments = math.ceil(file_size / payload_size)
+    full_file_md5 = bytes.fromhex(index.digest(entry, 'md5'))
+
+    log.info("- Tamanho do arquivo: %.2f KB", file_size / 1024)
+    log.info("- Payload por segmento: %s bytes", payload_size)
+    log.info("- Número de segmentos: %s", total_segments)
+    log.info("- Hash MD5: %s", full_file_md5.hex())
+    log.info("- Clientes inscritos: %s", len(subscribers))
+
+    # O pacote de informações carrega os metadados do arquivo e, se houver, o grupo multicast
+    info_payload = struct.pack(INFO_FORMAT, full_file_md5, file_size, file_mtime, payload_size)
+    if MULTICAST_GROUP:
+        info_payload += f"{MULTICAST_GROUP}:{MULTICAST_PORT}".encode()
+    info_packet = create_header(0, total_segments, b'\x00'*16, INFO) + info_payload
+
+    for address in subscribers:
+        sock.sendto(info_packet, address)
+    log.info("Pacote de metadados enviado para os clientes.")
+    started_at = {address: time.perf_counter() for address in subscribers}
+    active_sessions.set(len(subscribers))
+
+    # Passada única: cada pacote é montado uma vez e enviado a todos os inscritos
+    if MULTICAST_GROUP:
+        destinations = [(MULTICAST_GROUP, MULTICAST_PORT)]
+    else:
+        destinations = [address for address in subscribers if address not in resuming]
+
+    log.info("Iniciando transferência do arquivo...")
+    pass_bytes = 0
+    for i in range(total_segments):
+        data_packet = build_data_packet(file_content, i, total_segments, payload_size)
+        if i == 0 and destinations:
+            time_to_first_byte.observe(time.perf_counter() - request_time)
+        for address in destinations:
+            sock.sendto(data_packet, address)
+        pass_bytes += len(data_packet) * len(destinations)
+
+    # Contabiliza a passada de uma vez, fora do laço de envio
+    segments_sent.inc(total_segments * len(destinations))
+    bytes_sent.inc(pass_bytes)
+    log.info("Transferência completada.")
+
+    # Lida com o processo de retransmissão, cliente a cliente
+    last_seen = {address: time.monotonic() for address in subscribers}
+    while last_seen:
+        now = time.monotonic()
+        for address, seen in list(last_seen.items()):
+            if now - seen > CLIENT_TIMEOUT:
+                log.warning("O cliente %s expirou. Encerrando a conexão.", address)
+                del last_seen[address]
+                transfers_expired.inc()
+                active_sessions.dec()
+        if not last_seen:
+            break
+
+        try:
+            sock.settimeout(1.0)
+            response, sender_address = sock.recvfrom(BUFFER_SIZE)
+        except socket.timeout:
+            continue
+
+        try:
+            _, _, _, msg_type = unpack_header(response)
+        except struct.error:
+            ignored_packets.log("-- Ignorando pacote! --")
+            continue
+
+        if handle_control(sock, response, sender_address):
+            continue
+
+        if sender_address not in last_seen:
+            requested, options = parse_request(response)
+            if (msg_type == REQ and requested == filename
+                    and negotiated_payload_size(options) == payload_size):
+                # Cliente atrasado pedindo o mesmo arquivo: entra na sessão e
+                # recebe uma passada própria (ou só os NACKs, se estiver retomando)
+                log.info("Cliente %s entrou na transferência de '%s' em andamento.",
+                         sender_address, filename)
+                sock.sendto(info_packet, sender_address)
+                started_at[sender_address] = time.perf_counter()
+                if 'RESUME' not in options:
+                    pass_bytes = 0
+                    for i in range(total_segments):
+                        data_packet = build_data_packet(file_content, i, total_segments, payload_size)
+                        sock.sendto(data_packet, sender_address)
+                        pass_bytes += len(data_packet)
+                    segments_sent.inc(total_segments)
+                    bytes_sent.inc(pass_bytes)
+                last_seen[sender_address] = time.monotonic()
+                active_sessions.inc()
+            elif msg_type == REQ:
+                log.info("Cliente %s tentou conectar enquanto servidor ocupado (durante retransmissão). "
+                         "Adicionando à fila de espera.", sender_address)
+                waiting_clients.append((response, sender_address))
+                queue_depth.set(len(waiting_clients))
+                send_busy(sock, sender_address)
+            else:
+                ignored_packets.log("-- Ignorando pacotes de fonte inesperada: %s", sender_address)
+            continue
+
+        last_seen[sender_address] = time.monotonic()
+
+        if msg_type == NACK:
+            # O cliente está requerindo retransmissões
+            try:
+                missing_seqs = parse_nack(response[HEADER_SIZE:])
+            except ValueError:
+                log.warning("-- NACK inválido de %s --", sender_address)
+                continue
+
+            nacks_received.inc()
+            resent_bytes = 0
+            resent = 0
+            for seq_num in missing_seqs:
+                if 0 <= seq_num < total_segments:
+                    data_packet = build_data_packet(file_content, seq_num, total_segments, payload_size)
+                    sock.sendto(data_packet, sender_address)
+                    resent_bytes += len(data_packet)
+                    resent += 1
+            segments_sent.inc(resent)
+            segments_retransmitted.inc(resent)
+            bytes_sent.inc(resent_bytes)
+            log.info("%s pacotes foram reenviados para %s.", len(missing_seqs), sender_address)
+
+        elif msg_type == ACK:
+            # Cliente confirmou a transferência
+            log.info("O cliente %s confirmou a transferência com sucesso de: '%s'.",
+                     sender_address, filename)
+            del last_seen[sender_address]
+            elapsed = time.perf_counter() - started_at[sender_address]
+            transfers_completed.inc()
+            active_sessions.dec()
+            transfer_time.observe(elapsed)
+            if elapsed > 0:
+                transfer_throughput.observe(file_size / elapsed / 1024 / 1024)
+
+        elif msg_type == REQ:
+            # Requisição repetida (o INFO pode ter se perdido)
+            sock.sendto(info_packet, sender_address)
+
+
 def main():
     """Função main para rodar o servidor UDP."""
+    logger.setup()
+
+    if not os.path.exists(FILES_DIR):
+        os.makedirs(FILES_DIR)
+        print(f"Pasta '{FILES_DIR}' criada. Coloque aqui os arquivos para download.")
+    index.start()
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((HOST, PORT))
+    if MULTICAST_GROUP:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        print(f"Multicast habilitado no grupo {MULTICAST_GROUP}:{MULTICAST_PORT}")
     print(f"Servidor escutando em {HOST}:{PORT}")
 
-    busy = False
     waiting_clients = []
 
     while True:
-        print("\nEsperando por um novo cliente...")
-        try:
-            # Se houver clientes esperando, processa imediatamente
-            if waiting_clients:
-                print(f"Processando cliente em espera...")
-                request, client_address = waiting_clients.pop(0)
-            else:
-                sock.settimeout(2.0 if busy else None)
-                request, client_address = sock.recvfrom(BUFFER_SIZE)
-
-            if busy:
-                print(
-                    f"Cliente {client_address} tentou conectar enquanto servidor ocupado. Adicionando à fila de espera.")
-                waiting_clients.append((request, client_address))
-                # Mensagem para o cliente aguardando
-                wait_header = create_header(0, 0, b'\x00'*16, INFO)
-                wait_msg = b"Servidor ocupado, aguarde..."
-                sock.sendto(wait_header + wait_msg, client_address)
-                continue
+        log.info("Esperando por um novo cliente...")
+        # Se houver clientes esperando, processa imediatamente
+        if waiting_clients:
+            log.info("Processando cliente em espera...")
+            request, client_address = waiting_clients.pop(0)
+        else:
+            sock.settimeout(None)
+            request, client_address = sock.recvfrom(BUFFER_SIZE)
+        request_time = time.perf_counter()
+
+        if handle_control(sock, request, client_address):
+            continue
 
-            busy = True
-            # Supõe que a solicitação está no formato "GET /filename.ext"
-            filename = request.decode().strip().split(' ')[1][1:]
-            print(
-                f"solicitação de arquivo '{filename}' recebida de {client_address}")
-
-            # Verifica se o arquivo existe
-            if not os.path.exists(filename):
-                print(f"Arquivo não encontrado: {filename}")
-                error_header = create_header(0, 0, b'\x00'*16, ERR)
-                error_message = b"Arquivo nao encontrado"
-                sock.sendto(error_header + error_message, client_address)
-                busy = False
-                continue
+        filename, options = parse_request(request)
+        if filename is None:
+            ignored_packets.log("-- Ignorando pacote de %s: não é uma requisição válida --", client_address)
+            continue
 
-            # Lê o arquivo existente
-            with open(filename, 'rb') as f:
-                file_content = f.read()
-
-            file_size = len(file_content)
-            total_segments = math.ceil(file_size / PAYLOAD_SIZE)
-            full_file_md5 = calculate_md5(file_content)
-
-            print(f"\n- Tamanho do arquivo: {file_size / 1024:.2f} KB")
-            print(f"- Número de segmentos: {total_segments}")
-            print(f"- Hash MD5: {full_file_md5.hex()}")
-
-            # Manda um pacote de informoções com os metadados (header e hash MD5)
-            info_header = create_header(0, total_segments, b'\x00'*16, INFO)
-            sock.sendto(info_header + full_file_md5, client_address)
-            print("\nPacote de metadados enviado para o cliente.")
-
-            # Manda todos os pacotes de dados
-            print("\nIniciando transferência do arquivo...")
-            for i in range(total_segments):
-                start = i * PAYLOAD_SIZE
-                end = start + PAYLOAD_SIZE
-                chunk = file_content[start:end]
-                chunk_md5 = calculate_md5(chunk)
-
-                data_header = create_header(i, total_segments, chunk_md5, DATA)
-                sock.sendto(data_header + chunk, client_address)
-
-            print("Transferência completada.")
-
-            # Lida com o processo de retransmissão dos arquivos
-            while True:
-                try:
-                    sock.settimeout(10.0)
-                    response, sender_address = sock.recvfrom(BUFFER_SIZE)
-
-                    # Verifica se é uma nova requisição de outro cliente
-                    try:
-                        _, _, _, msg_type = unpack_header(response)
-                    except struct.error:
-                        print(f"-- Ignorando pacote! --")
-                        continue
-
-                    if sender_address != client_address:
-                        if msg_type == REQ:
-                            print(
-                                f"Cliente {sender_address} tentou conectar enquanto servidor ocupado (durante retransmissão). Adicionando à fila de espera.")
-                            waiting_clients.append((response, sender_address))
-                            wait_header = create_header(0, 0, b'\x00'*16, BUSY)
-                            wait_msg = b"Servidor ocupado, aguarde..."
-                            sock.sendto(wait_header + wait_msg, sender_address)
-                        else:
-                            print(
-                                f"-- Ignorando pacotes de fonte inesperada: {sender_address}")
-                        continue
-
-                    if msg_type == NACK:
-                        # O cliente está requerindo retransmissões
-                        missing_seqs_str = response[HEADER_SIZE:].decode()
-                        missing_seqs = [int(s)
-                                        for s in missing_seqs_str.split(',')]
-                        # print(f"NACK recebido para os segmentos: {missing_seqs}")
-
-                        for seq_num in missing_seqs:
-                            start = seq_num * PAYLOAD_SIZE
-                            end = start + PAYLOAD_SIZE
-                            chunk = file_content[start:end]
-                            chunk_md5 = calculate_md5(chunk)
-
-                            data_header = create_header(
-                                seq_num, total_segments, chunk_md5, DATA)
-                            sock.sendto(data_header + chunk, client_address)
-                        print(
-                            f"\n{len(missing_seqs)} pacotes foram reenviados.")
-
-                    elif msg_type == ACK:
-                        # Cliente confirmou a transferência
-                        print(
-                            f"\nO cliente {client_address} confirmou a transferência com sucesso de: '{filename}'.")
-                        break
-
-                except socket.timeout:
-                    print(
-                        f"\nO cliente {client_address} expirou. Encerrando a conexão.")
-                    break
-            busy = False
-        except socket.timeout:
+        gather_requests(sock, waiting_clients, COALESCE_WINDOW)
+
+        # Junta na mesma transmissão todos os clientes que aguardam o mesmo arquivo
+        waiting_clients.insert(0, (request, client_address))
+        payload_size = negotiated_payload_size(options)
+        subscribers, resuming = collect_subscribers(
+            filename, payload_size, client_address, waiting_clients)
+        queue_depth.set(len(waiting_clients))
+        log.info("solicitação de arquivo '%s' recebida de %s cliente(s): %s",
+                 filename, len(subscribers), subscribers)
+
+        # Verifica se o arquivo existe
+        entry = index.lookup(filename)
+        if entry is None:
+            log.warning("Arquivo não encontrado: %s", filename)
+            error_header = create_header(0, 0, b'\x00'*16, ERR)
+            error_message = b"Arquivo nao encontrado"
+            for address in subscribers:
+                sock.sendto(error_header + error_message, address)
             continue
 
+        serve_file(sock, filename, entry, payload_size, subscribers, resuming, waiting_clients,
+                   request_time)
+        active_sessions.set(0)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1 @@
+"""Código compartilhado entre os servidores TCP, HTTP e UDP."""
@@ -0,0 +1,261 @@
+"""
+Índice em memória da pasta servida (FILES_DIR), compartilhado pelos servidores.
+
+Cada arquivo vira uma entrada com tamanho, mtime, MIME type e os hashes já
+calculados, então resolver uma requisição é um acesso ao dicionário em vez de
+várias chamadas a os.path. Uma thread relê a pasta periodicamente e só recria
+as entradas dos arquivos que mudaram (tamanho ou mtime), mantendo os hashes dos
+demais. Nomes com '..', absolutos ou ocultos são recusados.
+
+Os arquivos abertos ficam num cache LRU; as leituras usam offsets explícitos
+(os.pread / os.sendfile), então várias threads compartilham o mesmo descritor.
+"""
+import collections
+import hashlib
+import mimetypes
+import os
+import select
+import socket
+import threading
+import time
+
+RESCAN_INTERVAL = 2.0  # Segundos entre as releituras da pasta
+MAX_OPEN_FILES = 64  # Arquivos mantidos abertos no cache LRU
+READ_CHUNK = 1024 * 1024
+DEFAULT_MIME = 'application/octet-stream'
+
+
+def normalize_name(name):
+    """
+    Converte o nome pedido por um cliente ('/a/b.txt', 'a//b.txt'...) na chave do
+    índice ('a/b.txt'). Retorna None se o nome sairia da pasta ou for oculto.
+    """
+    parts = [part for part in (name or '').replace(os.sep, '/').split('/') if part not in ('', '.')]
+    if not parts or any(part == '..' or part.startswith('.') for part in parts):
+        return None
+    return '/'.join(parts)
+
+
+class FileEntry:
+    """Metadados de um arquivo servido."""
+
+    def __init__(self, name, path, st):
+        self.name = name
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.mime = mimetypes.guess_type(name)[0] or DEFAULT_MIME
+        self.digests = {}  # Algoritmo -> hash hex, calculado na primeira vez que é pedido
+
+    def same_file(self, st):
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns
+
+
+class _OpenFile:
+    """Arquivo no cache LRU; só é fechado quando ninguém mais o está lendo."""
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.fd = os.open(entry.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.refs = 0
+        self.evicted = False
+        self.lock = threading.Lock()  # Só usado onde não há os.pread
+
+
+class FileIndex:
+    """Índice de uma pasta. Chame start() para fazer a primeira leitura e ligar as releituras."""
+
+    def __init__(self, root, rescan_interval=RESCAN_INTERVAL, max_open_files=MAX_OPEN_FILES):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.max_open_files = max_open_files
+        self._entries = {}
+        self._open_files = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Lê a pasta e inicia a thread de releitura periódica."""
+        self.rescan()
+        if self._thread is None and self.rescan_interval:
+            self._thread = threading.Thread(target=self._rescan_loop, daemon=True)
+            self._thread.start()
+
+    def _rescan_loop(self):
+        while True:
+            time.sleep(self.rescan_interval)
+            try:
+                self.rescan()
+            except OSError:
+                pass
+
+    def rescan(self):
+        """Atualiza o índice com o conteúdo atual da pasta, reaproveitando as entradas que não mudaram."""
+        with self._lock:
+            current = dict(self._entries)
+        found = {}
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                entry = current.get(name)
+                found[name] = entry if entry and entry.same_file(st) else FileEntry(name, path, st)
+
+        with self._lock:
+            self._entries = found
+            # Descritores de arquivos que mudaram ou sumiram não servem mais
+            for name in [name for name, opened in self._open_files.items()
+                         if found.get(name) is not opened.entry]:
+                self._evict(name)
+
+    def lookup(self, name):
+        """
+        Entrada do arquivo pedido, ou None se ele não existe ou o nome é inválido.
+        Um arquivo criado depois da última releitura custa um os.stat.
+        """
+        name = normalize_name(name)
+        if name is None:
+            return None
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = self.refresh(name)
+        return entry
+
+    def refresh(self, name, sha256=None):
+        """
+        Relê um arquivo (e.g., logo depois de um upload) sem esperar a próxima releitura.
+        'sha256', se dado, já fica no cache de hashes.
+        """
+        name = normalize_name(name)
+        if name is None:
+            return None
+        path = os.path.join(self.root, *name.split('/'))
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        with self._lock:
+            if st is None or not os.path.isfile(path):
+                self._entries.pop(name, None)
+                self._evict(name)
+                return None
+            entry = self._entries.get(name)
+            if entry is None or not entry.same_file(st):
+                entry = FileEntry(name, path, st)
+                self._entries[name] = entry
+                self._evict(name)
+        if sha256:
+            entry.digests['sha256'] = sha256
+        return entry
+
+    def entries(self):
+        """Todas as entradas, ordenadas pelo nome."""
+        with self._lock:
+            return [self._entries[name] for name in sorted(self._entries)]
+
+    def digest(self, entry, algorithm='sha256'):
+        """Hash hex do arquivo, calculado uma vez por versão do arquivo."""
+        value = entry.digests.get(algorithm)
+        if value is None:
+            hasher = hashlib.new(algorithm)
+            offset = 0
+            while offset < entry.size:
+                chunk = self.read(entry, offset, READ_CHUNK)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                offset += len(chunk)
+            value = entry.digests[algorithm] = hasher.hexdigest()
+        return value
+
+    def read(self, entry, offset=0, size=None):
+        """Lê 'size' bytes (por padrão até o fim) a partir de 'offset'."""
+        if size is None:
+            size = entry.size - offset
+        opened = self._acquire(entry)
+        try:
+            return self._pread(opened, size, offset)
+        finally:
+            self._release(opened)
+
+    def sendfile(self, sock, entry, offset=0, count=None):
+        """Envia o conteúdo do arquivo pelo socket, com os.sendfile quando disponível."""
+        if count is None:
+            count = entry.size - offset
+        opened = self._acquire(entry)
+        try:
+            if hasattr(os, 'sendfile'):
+                timeout = sock.gettimeout()
+                while count > 0:
+                    try:
+                        sent = os.sendfile(sock.fileno(), opened.fd, offset, min(count, READ_CHUNK))
+                    except BlockingIOError:
+                        # Socket com timeout (não bloqueante por baixo): espera poder escrever
+                        if not select.select([], [sock], [], timeout)[1]:
+                            raise socket.timeout("sendfile timed out")
+                        continue
+                    if sent == 0:
+                        break
+                    offset += sent
+                    count -= sent
+            else:
+                while count > 0:
+                    chunk = self._pread(opened, min(count, READ_CHUNK), offset)
+                    if not chunk:
+                        break
+                    sock.sendall(chunk)
+                    offset += len(chunk)
+                    count -= len(chunk)
+        finally:
+            self._release(opened)
+
+    def _pread(self, opened, size, offset):
+        if hasattr(os, 'pread'):
+            chunks = []
+            while size > 0:
+                chunk = os.pread(opened.fd, size, offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+                size -= len(chunk)
+            return b''.join(chunks)
+        with opened.lock:
+            os.lseek(opened.fd, offset, os.SEEK_SET)
+            return os.read(opened.fd, size)
+
+    def _acquire(self, entry):
+        with self._lock:
+            opened = self._open_files.get(entry.name)
+            if opened is None or opened.entry is not entry:
+                if opened is not None:
+                    self._evict(entry.name)
+                opened = self._open_files[entry.name] = _OpenFile(entry)
+            self._open_files.move_to_end(entry.name)
+            opened.refs += 1
+            while len(self._open_files) > self.max_open_files:
+                self._evict(next(iter(self._open_files)))
+            return opened
+
+    def _release(self, opened):
+        with self._lock:
+            opened.refs -= 1
+            if opened.evicted and opened.refs == 0:
+                os.close(opened.fd)
+
+    def _evict(self, name):
+        # Chamado com self._lock
+        opened = self._open_files.pop(name, None)
+        if opened is None:
+            return
+        opened.evicted = True
+        if opened.refs == 0:
+            os.close(opened.fd)
@@ -0,0 +1,106 @@
+"""
+Logging compartilhado pelos servidores e clientes.
+
+Os handlers das threads só colocam o registro numa fila; uma thread à parte
+formata e escreve no terminal, então um terminal lento não segura o laço de
+rede. Mensagens repetitivas dos laços quentes passam por Progress (progresso
+limitado por tempo) ou Throttle (no máximo uma mensagem por intervalo).
+
+O modo silencioso (só avisos e erros) é ligado com setup(quiet=True) ou com a
+variável de ambiente REDES_QUIET=1; REDES_LOG_LEVEL escolhe outro nível.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+QUIET_ENV = 'REDES_QUIET'
+LEVEL_ENV = 'REDES_LOG_LEVEL'
+LOG_FORMAT = '%(message)s'
+
+_listener = None
+
+
+def setup(quiet=None, level=None, stream=None):
+    """
+    Configura o logger raiz com um sink assíncrono. Pode ser chamada de novo
+    para trocar o nível (e.g., um benchmark ligando o modo silencioso).
+    """
+    global _listener
+
+    if quiet is None:
+        quiet = os.environ.get(QUIET_ENV, '') not in ('', '0')
+    if level is None:
+        level = os.environ.get(LEVEL_ENV, 'WARNING' if quiet else 'INFO')
+
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        # Esvazia a fila antes de o processo terminar
+        atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    """Retorna o logger do módulo (equivalente a logging.getLogger)."""
+    return logging.getLogger(name)
+
+
+class Throttle:
+    """
+    Emite uma mensagem no máximo uma vez a cada 'interval' segundos e conta
+    quantas foram suprimidas nesse meio tempo.
+    """
+
+    def __init__(self, logger, interval=1.0, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self.last = float('-inf')
+        self.suppressed = 0
+
+    def log(self, msg, *args):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            self.suppressed += 1
+            return
+        if self.suppressed:
+            msg += f" (+{self.suppressed} suppressed)"
+            self.suppressed = 0
+        self.last = now
+        self.logger.log(self.level, msg, *args)
+
+
+class Progress:
+    """
+    Relata o progresso de uma transferência (feitos/total) no máximo a cada
+    'interval' segundos, e sempre ao chegar no total.
+    """
+
+    def __init__(self, logger, label, total, interval=0.5):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.enabled = logger.isEnabledFor(logging.INFO)
+        self.last = float('-inf')
+
+    def update(self, done):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if done < self.total and now - self.last < self.interval:
+            return
+        self.last = now
+        self.logger.info("%d/%d %s", done, self.total, self.label)
@@ -0,0 +1,168 @@
+"""
+Contadores, gauges e histogramas em memória para os servidores.
+
+Cada métrica tem seu próprio lock e só guarda números, então registrar um valor
+custa poucas operações. O estado pode ser lido como dicionário (snapshot) ou no
+formato texto do Prometheus (render_prometheus).
+"""
+import bisect
+import threading
+
+# Limites superiores dos buckets padrão
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+THROUGHPUT_BUCKETS = (0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # MB/s
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """Valor que só cresce (bytes enviados, requisições atendidas...)."""
+
+    kind = 'counter'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Valor que sobe e desce (sessões ativas, tamanho de fila...)."""
+
+    kind = 'gauge'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Distribuição de observações em buckets fixos (latências, vazões...)."""
+
+    kind = 'histogram'
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # O último é o +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Estimativa do quantil: o limite superior do bucket onde ele cai."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        target = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.count, self.sum
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": total,
+            "sum": round(total_sum, 6),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+def _get_or_create(name, labels, factory):
+    key = (name, tuple(sorted((labels or {}).items())))
+    metric = _registry.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(key, factory())
+    return metric
+
+
+def counter(name, labels=None):
+    """Retorna (criando se preciso) o contador com esse nome e labels."""
+    return _get_or_create(name, labels, Counter)
+
+
+def gauge(name, labels=None):
+    """Retorna (criando se preciso) o gauge com esse nome e labels."""
+    return _get_or_create(name, labels, Gauge)
+
+
+def histogram(name, buckets=LATENCY_BUCKETS, labels=None):
+    """Retorna (criando se preciso) o histograma com esse nome e labels."""
+    return _get_or_create(name, labels, lambda: Histogram(buckets))
+
+
+def _format_key(name, labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def snapshot():
+    """Todas as métricas num dicionário serializável em JSON."""
+    with _registry_lock:
+        items = sorted(_registry.items())
+    return {_format_key(name, labels): metric.snapshot() for (name, labels), metric in items}
+
+
+def render_prometheus():
+    """Todas as métricas no formato de exposição texto do Prometheus."""
+    with _registry_lock:
+        items = sorted(_registry.items())
+    lines = []
+    declared = set()
+    for (name, labels), metric in items:
+        if name not in declared:
+            lines.append(f"# TYPE {name} {metric.kind}")
+            declared.add(name)
+        if metric.kind != 'histogram':
+            lines.append(f"{_format_key(name, labels)} {metric.snapshot()}")
+            continue
+        data = metric.snapshot()
+        for bound, cumulative in data['buckets'].items():
+            lines.append(f"{_format_key(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{_format_key(name + '_sum', labels)} {data['sum']}")
+        lines.append(f"{_format_key(name + '_count', labels)} {data['count']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TCP_DIR = os.path.join(ROOT_DIR, 'TCP')
+UDP_DIR = os.path.join(ROOT_DIR, 'UDP')
+FILES_DIR = os.path.join(ROOT_DIR, 'server_files')
+
+sys.path.insert(0, TCP_DIR)
+sys.path.insert(0, ROOT_DIR)
+import protocol  # noqa: E402
+from common import log as logger  # noqa: E402
+
+# Portas fixas dos servidores (ver HOST/PORT de cada um)
+TCP_PORT = 12345
+HTTP_PORT = 8080
+UDP_PORT = 9999
+PROXY_PORT = 9000  # Porta do UDP/impairment_proxy.py quando --udp-impairment é usado
+
+BENCH_PREFIX = 'bench_'
+STARTUP_TIMEOUT = 10.0
+
+
+def load_udp_client():
+    """Carrega UDP/client.py com outro nome (TCP/client.py já ocupa 'client')."""
+    spec = importlib.util.spec_from_file_location('udp_client', os.path.join(UDP_DIR, 'client.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cpu_seconds(pid):
+    """Lê o tempo de CPU (user + system) de um processo em /proc (Linux)."""
+    with open(f'/proc/{pid}/stat') as f:
+        # O nome do processo pode conter espaços; os campos vêm após o ')'
+        fields = f.read().rsplit(')', 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values, pct):
+    """Percentil por vizinho mais próximo de uma lista de amostras."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def wait_for_tcp(port):
+    """Espera até que um servidor TCP local aceite conexões."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+@contextlib.contextmanager
+def spawn_server(script, cwd, port=None):
+    """Inicia um dos servidores como subprocesso e o encerra no final."""
+    # stdin fica aberto (e vazio) para o console do servidor TCP não receber EOF;
+    # o modo silencioso tira o log por requisição da medição
+    proc = subprocess.Popen([sys.executable, script], cwd=cwd, stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            env={**os.environ, logger.QUIET_ENV: '1'})
+    try:
+        if port is not None:
+            wait_for_tcp(port)
+        else:
+            time.sleep(0.5)
+        if proc.poll() is not None:
+            raise RuntimeError(f"{script} exited during startup (port in use?)")
+        yield proc
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def run_workload(proc, concurrency, requests, worker):
+    """
+    Executa 'worker' em 'concurrency' threads, 'requests' vezes cada, e mede
+    latência, bytes transferidos e CPU do servidor durante a carga.
+    """
+    latencies = []
+    errors = []
+    transferred = [0]
+    lock = threading.Lock()
+
+    def loop(worker_id):
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                nbytes = worker(worker_id)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                transferred[0] += nbytes
+
+    cpu_before = cpu_seconds(proc.pid)
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall_start
+    server_cpu = cpu_seconds(proc.pid) - cpu_before
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_s": round(wall, 4),
+        "requests_per_s": round(len(latencies) / wall, 2),
+        "throughput_mb_s": round(transferred[0] / wall / 1024 / 1024, 3),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            "p99": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            "max": round(max(latencies) * 1000, 3) if latencies else None,
+        },
+        "server_cpu_s": round(server_cpu, 3),
+        "server_cpu_percent": round(100 * server_cpu / wall, 1),
+    }
+
+
+def tcp_file_worker(filename):
+    """Cria um worker que baixa 'filename' do servidor TCP numa conexão nova."""
+    def worker(_):
+        with socket.create_connection(('127.0.0.1', TCP_PORT)) as sock:
+            protocol.send_json(sock, {"type": "FILE_REQ", "filename": filename})
+            meta = protocol.receive_json(sock)
+            if not meta or meta.get('status') != 'OK':
+                raise RuntimeError(f"FILE_REQ failed: {meta}")
+            remaining = meta['filesize']
+            while remaining:
+                chunk = sock.recv(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise RuntimeError("Connection closed during transfer")
+                remaining -= len(chunk)
+            protocol.send_json(sock, {"type": "EXIT"})
+            return meta['filesize']
+    return worker
+
+
+def tcp_chat_worker(messages):
+    """Cria um worker que envia uma rajada de mensagens de chat numa conexão."""
+    def worker(worker_id):
+        with socket.create_connection(('127.0.0.1', TCP_PORT)) as sock:
+            for i in range(messages):
+                protocol.send_json(sock, {"type": "CHAT", "message": f"bench {worker_id}/{i}"})
+            protocol.send_json(sock, {"type": "EXIT"})
+        return 0
+    return worker
+
+
+def http_worker(filename):
+    """Cria um worker que faz um GET HTTP do arquivo."""
+    def worker(_):
+        conn = http.client.HTTPConnection('127.0.0.1', HTTP_PORT, timeout=30)
+        try:
+            conn.request('GET', '/' + filename)
+            response = conn.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            return len(body)
+        finally:
+            conn.close()
+    return worker
+
+
+@contextlib.contextmanager
+def spawn_proxy(impairment_args, stats):
+    """
+    Inicia o relay de degradação na frente do servidor UDP. Ao encerrar, guarda
+    em 'stats' os contadores de pacotes perdidos/duplicados/reordenados.
+    """
+    command = [sys.executable, 'impairment_proxy.py', '--listen', f'127.0.0.1:{PROXY_PORT}',
+               '--server', f'127.0.0.1:{UDP_PORT}', *shlex.split(impairment_args)]
+    proc = subprocess.Popen(command, cwd=UDP_DIR, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    try:
+        time.sleep(0.5)
+        if proc.poll() is not None:
+            raise RuntimeError("impairment_proxy.py exited during startup")
+        yield
+    finally:
+        proc.send_signal(signal.SIGINT)
+        output, _ = proc.communicate(timeout=5)
+        if output.strip():
+            stats.update(json.loads(output.strip().splitlines()[-1]))
+
+
+def udp_worker(udp_client, filename, work_dirs, port):
+    """Cria um worker que baixa o arquivo pelo protocolo UDP (um socket por download)."""
+    def worker(worker_id):
+        sock = udp_client.create_socket()
+        try:
+            payload_size = udp_client.probe_payload_size(sock, ('127.0.0.1', port))
+            ok = udp_client.download_file(sock, ('127.0.0.1', port), filename,
+                                          payload_size=payload_size,
+                                          output_dir=work_dirs[worker_id])
+        finally:
+            sock.close()
+        if not ok:
+            raise RuntimeError("UDP transfer failed")
+        output = os.path.join(work_dirs[worker_id], f"received_{os.path.basename(filename)}")
+        size = os.path.getsize(output)
+        os.remove(output)
+        return size
+    return worker
+
+
+def create_bench_files(sizes_kb):
+    """Gera arquivos aleatórios em server_files para a carga de trabalho."""
+    names = []
+    for size_kb in sizes_kb:
+        name = f"{BENCH_PREFIX}{size_kb}k.bin"
+        with open(os.path.join(FILES_DIR, name), 'wb') as f:
+            f.write(os.urandom(size_kb * 1024))
+        names.append(name)
+    return names
+
+
+def main():
+    """Roda a carga nos servidores escolhidos e imprime o resultado em JSON."""
+    parser = argparse.ArgumentParser(description="Headless benchmark for the TCP, HTTP and UDP servers.")
+    parser.add_argument('--servers', default='tcp,http,udp',
+                        help="comma-separated subset of tcp,http,udp (default: all)")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent clients per workload")
+    parser.add_argument('--requests', type=int, default=10, help="requests per client")
+    parser.add_argument('--file-sizes', default='64,1024', help="comma-separated file sizes in KB")
+    parser.add_argument('--chat-messages', type=int, default=100,
+                        help="chat messages per TCP chat request")
+    parser.add_argument('--udp-impairment', metavar='ARGS',
+                        help="route UDP transfers through UDP/impairment_proxy.py with these "
+                             "arguments, e.g. \"--loss 0.02 --reorder 0.01 --seed 1\"")
+    parser.add_argument('--output', help="append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    servers = args.servers.split(',')
+    sizes_kb = [int(x) for x in args.file_sizes.split(',')]
+    os.makedirs(FILES_DIR, exist_ok=True)
+    bench_files = create_bench_files(sizes_kb)
+    results = []
+
+    def record(server, workload, file_size, stats):
+        stats.update({"server": server, "workload": workload, "file_size": file_size})
+        results.append(stats)
+        print(f"[{server}/{workload}] size={file_size} rps={stats['requests_per_s']} "
+              f"MB/s={stats['throughput_mb_s']} p50={stats['latency_ms']['p50']}ms "
+              f"p99={stats['latency_ms']['p99']}ms cpu={stats['server_cpu_percent']}% "
+              f"errors={stats['errors']}", file=sys.stderr)
+
+    try:
+        if 'tcp' in servers:
+            with spawn_server('server.py', TCP_DIR, TCP_PORT) as proc:
+                for name, size_kb in zip(bench_files, sizes_kb):
+                    record('tcp', 'file_req', size_kb * 1024, run_workload(
+                        proc, args.concurrency, args.requests, tcp_file_worker(name)))
+                record('tcp', 'chat', 0, run_workload(
+                    proc, args.concurrency, args.requests, tcp_chat_worker(args.chat_messages)))
+
+        if 'http' in servers:
+            with spawn_server('web_server.py', TCP_DIR, HTTP_PORT) as proc:
+                for name, size_kb in zip(bench_files, sizes_kb):
+                    record('http', 'get', size_kb * 1024, run_workload(
+                        proc, args.concurrency, args.requests, http_worker(name)))
+
+        if 'udp' in servers:
+            udp_client = load_udp_client()
+            work_dirs = [tempfile.mkdtemp(prefix='udp_bench_') for _ in range(args.concurrency)]
+            try:
+                logger.setup(quiet=True)
+                with spawn_server('server.py', UDP_DIR) as proc:
+                    for name, size_kb in zip(bench_files, sizes_kb):
+                        if args.udp_impairment is None:
+                            record('udp', 'download', size_kb * 1024, run_workload(
+                                proc, args.concurrency, args.requests,
+                                udp_worker(udp_client, name, work_dirs, UDP_PORT)))
+                            continue
+                        # Um relay novo por carga, para os contadores de perda serem dela
+                        impairment = {}
+                        with spawn_proxy(args.udp_impairment, impairment):
+                            stats = run_workload(
+                                proc, args.concurrency, args.requests,
+                                udp_worker(udp_client, name, work_dirs, PROXY_PORT))
+                        stats['impairment'] = impairment
+                        record('udp', 'download_impaired', size_kb * 1024, stats)
+            finally:
+                for work_dir in work_dirs:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        for name in bench_files:
+            os.remove(os.path.join(FILES_DIR, name))
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(report) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import log as logger  # noqa: E402
+
+PACKETS = 200000
+PAYLOAD = b'x' * 1400
+RECV_TIMEOUT = 1.0  # Sem pacotes por esse tempo = fim da rajada
+
+
+def blast(address, count):
+    """Envia 'count' datagramas o mais rápido possível."""
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for _ in range(count):
+        sender.sendto(PAYLOAD, address)
+    sender.close()
+
+
+def receive(mode, count):
+    """
+    Recebe uma rajada reportando o progresso como o cliente UDP faz e retorna
+    (pacotes recebidos, pacotes por segundo). Modos:
+      print    - um print por pacote (comportamento antigo do UDP/client.py)
+      progress - logger.Progress com o sink assíncrono
+      quiet    - logger.Progress com o modo silencioso
+    """
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(RECV_TIMEOUT)
+
+    logger.setup(quiet=(mode == 'quiet'))
+    progress = logger.Progress(logger.get_logger('benchmark'), "segmentos recebidos", count)
+
+    sender = threading.Thread(target=blast, args=(receiver.getsockname(), count))
+    received = 0
+    start = time.perf_counter()
+    last_packet = start
+    sender.start()
+    try:
+        while True:
+            receiver.recvfrom(2048)
+            received += 1
+            last_packet = time.perf_counter()
+            if mode == 'print':
+                print(f"\r{received}/{count} segmentos recebidos", end="")
+            else:
+                progress.update(received)
+    except socket.timeout:
+        pass
+    sender.join()
+    receiver.close()
+    if mode == 'print':
+        print()
+    return received, received / (last_packet - start)
+
+
+def main():
+    """Compara pacotes/s recebidos com print por pacote, progresso limitado e modo silencioso."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else PACKETS
+    results = []
+    for mode in ('print', 'progress', 'quiet'):
+        received, pps = receive(mode, count)
+        results.append((mode, received, pps))
+
+    # O resumo vai para stderr para não se misturar com o progresso medido
+    print(f"\n{'mode':>9} {'received':>9} {'loss':>7} {'packets/s':>10}", file=sys.stderr)
+    for mode, received, pps in results:
+        loss = 100 * (count - received) / count
+        print(f"{mode:>9} {received:>9} {loss:>6.1f}% {pps:>10.0f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()